@@ -16,18 +16,31 @@
 # You should have received a copy of the GNU General Public License
 # along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
+import os
+import mmap
+import asyncio
+import threading
+import concurrent.futures
 from . import (metadata, base, factories, elements, headings, lists, code,
-               formatting, links, quotes, html)
+               formatting, links, quotes, html, compact, aio, check,
+               pipeline)
+from .exceptions import _ParseInterrupted
 
 # Additional extension modules should insert their meta element classes in the
 #  list below; they must thus be imported *after* importing langmark, but
 #  *before* instantiating the Langmark class
 META_ELEMENTS = [metadata.Header,
-                 links.LinksData]
+                 links.LinksData,
+                 headings.HeadingsIndex,
+                 headings.SectionsIndex]
 
 # The order of the block element factories is important: put the most likey
 #  elements first; some elements may rely on the fact that others have been
 #  discarded
+# Factories with REORDERABLE set (code, lists, quotes and HTML) can't match
+#  the same lines, so a factories.FactoryProfile can reorder them among
+#  themselves according to the elements most frequently found in a corpus
 # Additional extension modules should insert their block-element factory
 #  classes in the list below; they must thus be imported *after* importing
 #  langmark, but *before* instantiating the Langmark class
@@ -76,16 +89,108 @@ INLINE_ELEMENTS = [formatting.Emphasis,
                    # If line breaks are disabled, enable the DOTALL version of
                    #  base.Configuration.ESCAPE_RE
                    elements.LineBreak,
-                   html.HTMLInlineTag]
+                   html.HTMLInlineTag,
+                   html.HTMLInlineComment]
+
+# The element classes that can be found in a parsed tree, which elements.Root
+#  can dump and load; they are identified in the dumped data by module and
+#  class name, and loading any other class is refused
+# Additional extension modules should insert their element classes in the list
+#  below; they must thus be imported *after* importing langmark, but *before*
+#  instantiating the Langmark class
+SERIALIZABLE_ELEMENTS = [base.RawText,
+                         elements.Root,
+                         elements.IndentedContainer,
+                         elements.Paragraph,
+                         elements.HorizontalRule,
+                         elements._Parameter,
+                         elements.LineBreak,
+                         headings.Heading1,
+                         headings.Heading2,
+                         headings.Heading3,
+                         headings.Heading4,
+                         headings.Heading5,
+                         headings.Heading6,
+                         lists.UnorderedListItem,
+                         lists.NumberedListItem,
+                         lists.LatinListItem,
+                         code.FormattableCodeInline,
+                         code.PlainCodeInline,
+                         code.PlainTextInline,
+                         code.FormattableCodeBlock,
+                         code.FormattableCodeBlockIndented,
+                         code.PlainCodeBlock,
+                         code.PlainCodeBlockIndented,
+                         code.PlainTextBlock,
+                         formatting.Emphasis,
+                         formatting.Strong,
+                         formatting.Superscript,
+                         formatting.Subscript,
+                         formatting.Small,
+                         formatting.Strikethrough,
+                         links.Link,
+                         quotes.BlockQuote,
+                         html.HTMLBlockTag,
+                         html.HTMLInlineTag,
+                         html.HTMLInlineComment]
 
 
 class Langmark:
-    def __init__(self):
+    def __init__(self, factory_profile=None, compact_tree=False, limits=None,
+                 text_link_urls=False, heading_ids=False, section_divs=False,
+                 index_elements=False, transforms=None, shared_links=None,
+                 extra_escapes='', preserve_entities=False):
         # The parameters for __init__ must reflect the attributes set through
         # argparse by the launcher script
-        elements._BlockElementContainingBlock.INSTALLED_BLOCK_FACTORIES = \
-                                                                BLOCK_FACTORIES
+        # With compact_tree the parsed elements are moved to a
+        #  compact.CompactTree as soon as they are complete, and etree is a
+        #  proxy for its root
+        self.compact = compact_tree
+        # factory_profile is an optional factories.FactoryProfile object
+        self.factory_profile = factory_profile
+        # limits is an optional base.Limits object, for untrusted documents;
+        #  exceeding a limit raises exceptions.LimitExceeded
+        self.limits = limits
+        # With text_link_urls convert_to_text also writes the URLs of the
+        #  links after their text
+        self.text_link_urls = text_link_urls
+        # With heading_ids the headings get an id attribute with their anchor
+        #  in doc.headings, which also provides the table of contents
+        self.heading_ids = heading_ids
+        # With section_divs each section in doc.sections, i.e. a top-level
+        #  heading and the elements until the next heading of the same or a
+        #  higher level, is enclosed in a <div> tag
+        self.section_divs = section_divs
+        # With index_elements doc.element_index is an elements.ElementIndex
+        #  of the elements created while parsing, see find_elements; the
+        #  elements of a compact tree are released as soon as they are
+        #  complete, so indexing them would defeat compact_tree
+        if index_elements and compact_tree:
+            raise ValueError('index_elements cannot be used with compact_tree')
+        self.index_elements = index_elements
+        self.element_index = None
+        # transforms is an optional list of pipeline.Transform objects, whose
+        #  visitors are run on each top-level element as soon as it's parsed,
+        #  in a single traversal
+        self.transforms = transforms
+        self.pipeline = None
+        # shared_links is an optional links.SharedLinks object, e.g. loaded
+        #  once per process and passed to all the Langmark objects, whose
+        #  link ids can be used without being defined in the document
+        self.shared_links = shared_links
+        # extra_escapes are the characters escaped in HTML other than "&"
+        #  and "<", among ">", '"' and "'"; with preserve_entities "&" isn't
+        #  escaped when it starts a valid character reference
+        self.escaper = base.HtmlEscaper(extra_escapes, preserve_entities)
+        # Only set by validate
+        self.validator = None
+        # The block factories tested by the containers, in order; set by parse
+        self.block_factories = None
         factories.IndentedElements.INSTALLED_ELEMENTS = INDENTED_ELEMENTS
+        elements.Root.SERIALIZABLE_ELEMENTS = SERIALIZABLE_ELEMENTS
+        elements.Root.META_ELEMENTS = META_ELEMENTS
+        for factory in BLOCK_FACTORIES:
+            factory.install()
         self.paragraph_factory = factories.ParagraphFactory()
         self._install_inline_elements()
 
@@ -108,9 +213,160 @@ class Langmark:
     def parse(self, stream):
         # The parameters for parse must reflect the attributes set through
         # argparse by the launcher script
-        # TODO: Support passing a string instead of a stream
+        # stream can be any iterator of lines, e.g. a file opened in text mode;
+        #  see also parse_string, parse_bytes and parse_file
+        # HeaderElements uninstalls itself while parsing, so every document
+        #  starts from a copy of BLOCK_FACTORIES
+        self.block_factories = list(BLOCK_FACTORIES)
+        if self.factory_profile:
+            self.factory_profile.install(self)
+        if self.limits is not None:
+            self.limits.start()
+            # The lines are checked as they are read, i.e. before any block
+            #  mark is matched against them
+            stream = self.limits.iterate_lines(stream)
         self.stream = base.Stream(stream)
+        self.container_stack = base.ContainerStack()
+        # Validating discards the elements tree, so it doesn't compact,
+        #  index or transform it
+        validating = self.validator is not None
+        self.compact_tree = compact.CompactTree(self, elements.Root) if \
+                                    self.compact and not validating else None
+        self.element_index = elements.ElementIndex() if \
+                            self.index_elements and not validating else None
         for Meta in META_ELEMENTS:
             setattr(self, Meta.ATTRIBUTE_NAME, Meta(self))
+        self.pipeline = pipeline.Pipeline(self.transforms) if \
+                                self.transforms and not validating else None
+        if self.pipeline is not None:
+            self.pipeline.start(self)
         self.etree = elements.Root(self)
         self.etree.parse_tree()
+        if self.pipeline is not None:
+            self.pipeline.finish(self)
+        if self.compact_tree is not None:
+            self.etree = self.compact_tree.get_root()
+
+    def dump(self, stream):
+        # Write the parsed document to a binary stream, e.g. a file opened in
+        #  "wb" mode, see elements.Root.dump
+        self.etree.dump(stream)
+
+    def load(self, stream):
+        # Load a document written by dump instead of parsing it; the loaded
+        #  tree is never compacted
+        self.compact_tree = None
+        self.element_index = None
+        self.etree = elements.Root.load(self, stream)
+        if self.index_elements:
+            # The loaded elements aren't initialized, so index them now
+            self.element_index = elements.ElementIndex()
+            for node in self.etree.iterate_by_class(elements._Element):
+                self.element_index.add(node)
+
+    def find_elements(self, Class):
+        # Yield the elements of the document that are instances of Class,
+        #  from the index if it was built, in time proportional to their
+        #  number; otherwise traversing the whole tree
+        if self.element_index is not None:
+            return self.element_index.find(Class)
+        return self.etree.iterate_by_class(Class)
+
+    def read_header(self, stream):
+        # Only read the header keys at the start of stream, e.g. a file opened
+        #  in text mode, stopping at the first line that isn't a header line
+        self.header = metadata.Header(self)
+        self.header.keys = factories.HeaderElements.read_keys(stream)
+        return self.header.keys
+
+    @staticmethod
+    def read_file_headers(paths, encoding='utf-8', max_workers=None):
+        # Yield a (path, keys) tuple for each file, reading their headers in
+        #  parallel threads
+        paths = list(paths)
+
+        def read_keys(path):
+            with open(path, 'r', encoding=encoding) as stream:
+                return factories.HeaderElements.read_keys(stream)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            yield from zip(paths, executor.map(read_keys, paths))
+
+    def validate(self, stream):
+        # Parse the document only to return a list of check.Diagnostic
+        #  objects; the elements tree is discarded while parsing, and the
+        #  inline elements aren't parsed: the links are found by scanning the
+        #  text of the blocks, see check.Validator.scan_links
+        self.validator = check.Validator()
+        try:
+            self.parse(stream)
+            return self.validator.get_diagnostics(self.links)
+        finally:
+            self.validator = None
+
+    def parse_string(self, text):
+        # Translate the newlines like a file opened in text mode
+        self.parse(io.StringIO(text, newline=None))
+
+    def parse_bytes(self, data, encoding='utf-8'):
+        # data can be any bytes-like object
+        self.parse(base.iterate_buffer_lines(data, encoding))
+
+    def parse_file(self, path, encoding='utf-8'):
+        # Map the file in memory instead of reading it in text mode, so that
+        #  its lines are only decoded while parsing
+        with open(path, 'rb') as file_:
+            if os.fstat(file_.fileno()).st_size == 0:
+                # Empty files can't be mapped
+                self.parse_bytes(b'', encoding)
+                return
+            with mmap.mmap(file_.fileno(), 0,
+                           access=mmap.ACCESS_READ) as buffer:
+                self.parse_bytes(buffer, encoding)
+
+    async def parse_async(self, source, encoding='utf-8', executor=None,
+                          timeout=None):
+        # source can be a string, a bytes-like object, an asyncio.StreamReader
+        #  or an async iterator of str or bytes lines, which is read in the
+        #  event loop while the parse runs in executor (the default executor
+        #  of the loop if None)
+        # If the coroutine is cancelled, or timeout seconds pass (raising
+        #  asyncio.TimeoutError), the parse is stopped before reading the next
+        #  line
+        loop = asyncio.get_running_loop()
+        if isinstance(source, (str, bytes, bytearray, memoryview)):
+            reader = None
+            chunks = (source, )
+        else:
+            reader = aio.AsyncSourceChunks(source, loop)
+            chunks = reader
+        interrupted = threading.Event()
+        future = loop.run_in_executor(executor, self._parse_interruptible,
+                                      base.iterate_chunk_lines(chunks,
+                                                               encoding),
+                                      interrupted)
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            interrupted.set()
+            if reader:
+                reader.close()
+
+    def _parse_interruptible(self, lines, interrupted):
+        def check_interrupt():
+            for line in lines:
+                if interrupted.is_set():
+                    raise _ParseInterrupted()
+                yield line
+
+        try:
+            self.parse(check_interrupt())
+        except _ParseInterrupted:
+            pass
+
+    async def iterate_html_async(self):
+        # Yield the HTML of the document in chunks, one per top-level element,
+        #  giving control back to the event loop between them
+        for chunk in self.etree.iterate_html():
+            yield chunk
+            await asyncio.sleep(0)
@@ -0,0 +1,77 @@
+# Langmark - A powerful and extensible lightweight markup language.
+# Copyright (C) 2015 Dario Giovannetti <dev@dariogiovannetti.net>
+#
+# This file is part of Langmark.
+#
+# Langmark is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Langmark is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import concurrent.futures
+from .exceptions import _ParseInterrupted
+
+
+class AsyncSourceChunks:
+    """
+    Iterator, for a parser running in another thread, of the chunks of an
+    asyncio.StreamReader or an async iterator of lines, which are read in the
+    event loop.
+    """
+    __slots__ = ('source', 'loop', 'future', 'closed')
+    CHUNK_SIZE = 1 << 16
+    # The number of lines read from an async iterator for each chunk
+    CHUNK_LINES = 1024
+
+    def __init__(self, source, loop):
+        if isinstance(source, asyncio.StreamReader):
+            self.source = source
+        else:
+            self.source = source.__aiter__()
+        self.loop = loop
+        self.future = None
+        self.closed = False
+
+    async def _read_chunk(self):
+        if isinstance(self.source, asyncio.StreamReader):
+            return await self.source.read(self.CHUNK_SIZE)
+        lines = []
+        try:
+            while len(lines) < self.CHUNK_LINES:
+                lines.append(await self.source.__anext__())
+        except StopAsyncIteration:
+            pass
+        if not lines:
+            return None
+        return (lines[0][:0]).join(lines)
+
+    def __iter__(self):
+        while True:
+            self.future = asyncio.run_coroutine_threadsafe(self._read_chunk(),
+                                                           self.loop)
+            # close may have been called before the future was created
+            if self.closed:
+                self.future.cancel()
+            try:
+                chunk = self.future.result()
+            except concurrent.futures.CancelledError:
+                raise _ParseInterrupted()
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        # Called in the event loop, also stops the parser thread if it's
+        #  waiting for a chunk
+        self.closed = True
+        if self.future is not None:
+            self.future.cancel()
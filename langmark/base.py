@@ -16,8 +16,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import re
-import itertools
+import array
+import bisect
+import time
+import codecs
 from .exceptions import (_BlockElementStartNotMatched,
                          _BlockElementStartConsumed,
                          _BlockElementStartMatched,
@@ -25,7 +29,8 @@ from .exceptions import (_BlockElementStartNotMatched,
                          _BlockElementEndConsumed,
                          _BlockElementEndNotConsumed,
                          _InlineElementStartNotMatched,
-                         _EndOfFile)
+                         _EndOfFile,
+                         LimitExceeded)
 
 
 class Configuration:
@@ -46,19 +51,197 @@ class Configuration:
     PARAMETER_CHAR = re.escape(r'|')
 
 
+class HtmlEscaper:
+    """
+    Escape text for HTML, always escaping "&" and "<", optionally also the
+    characters in extra_escapes, and optionally leaving "&" unescaped when it
+    starts a valid character reference (e.g. "&amp;" or "&#8212;").
+    """
+    __slots__ = ('replacements', 'attribute_replacements', 'escape_re',
+                 'escape', 'escape_attribute')
+    ENTITIES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+                "'": '&#39;'}
+    CHARACTER_REFERENCE = (r'&(?:#[0-9]+|#[xX][0-9a-fA-F]+|'
+                           r'[A-Za-z][A-Za-z0-9]*);')
+
+    def __init__(self, extra_escapes='', preserve_entities=False):
+        characters = ['&', '<']
+        for char in extra_escapes:
+            if char not in self.ENTITIES:
+                raise ValueError('cannot escape {!r}'.format(char))
+            if char not in characters:
+                characters.append(char)
+        # Attribute values, e.g. link URLs and titles, are always enclosed in
+        #  double quotes
+        attribute_characters = characters + ['"'] if '"' not in characters \
+                                                            else characters
+        # Chained str.replace calls are much faster than str.translate, whose
+        #  tables can only be fast when mapping characters to characters; "&"
+        #  is first, so that it's escaped *before* everything else
+        self.replacements = tuple((char, self.ENTITIES[char])
+                                  for char in characters)
+        self.attribute_replacements = tuple((char, self.ENTITIES[char])
+                                            for char in attribute_characters)
+        # Only preserving the character references needs a regular expression,
+        #  which then escapes all the characters in a single pass
+        if preserve_entities:
+            self.escape_re = re.compile('({})|[{}]'.format(
+                                self.CHARACTER_REFERENCE,
+                                re.escape(''.join(attribute_characters))))
+            self.escape = self._make_regex_escape(characters)
+            self.escape_attribute = self._make_regex_escape(
+                                                        attribute_characters)
+        else:
+            self.escape_re = None
+            self.escape = self._make_replace_escape(self.replacements)
+            self.escape_attribute = self._make_replace_escape(
+                                                self.attribute_replacements)
+
+    @staticmethod
+    def _make_replace_escape(replacements):
+        if replacements == (('&', '&amp;'), ('<', '&lt;')):
+            # The default escapes are chained without a loop, which would make
+            #  converting each text node noticeably slower
+            def escape(text):
+                return text.replace('&', '&amp;').replace('<', '&lt;')
+        else:
+            def escape(text):
+                for char, entity in replacements:
+                    text = text.replace(char, entity)
+                return text
+        return escape
+
+    def _make_regex_escape(self, characters):
+        entities = {char: self.ENTITIES[char] for char in characters}
+
+        def replace(match):
+            if match.group(1):
+                return match.group(1)
+            # Characters escaped only in attributes are left unchanged
+            return entities.get(match.group(), match.group())
+
+        def escape(text):
+            return self.escape_re.sub(replace, text)
+        return escape
+
+
+class Limits:
+    """
+    Resource limits for parsing untrusted documents; None disables a limit.
+    """
+    __slots__ = ('max_line_length', 'max_depth', 'max_inline_marks',
+                 'max_steps', 'max_time', 'steps', 'deadline')
+
+    def __init__(self, max_line_length=None, max_depth=None,
+                 max_inline_marks=None, max_steps=None, max_time=None):
+        self.max_line_length = max_line_length
+        # The nesting depth of block containers
+        self.max_depth = max_depth
+        # The inline marks, including the rejected ones, in each block
+        self.max_inline_marks = max_inline_marks
+        # Every source line and every inline mark is a step
+        self.max_steps = max_steps
+        # Wall-clock seconds
+        self.max_time = max_time
+        self.start()
+
+    def start(self):
+        self.steps = 0
+        self.deadline = None if self.max_time is None else \
+                                            time.monotonic() + self.max_time
+
+    def step(self, line_number):
+        self.steps += 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise LimitExceeded('max_steps', self.max_steps, line_number)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise LimitExceeded('max_time', self.max_time, line_number)
+
+    def iterate_lines(self, lines):
+        for line_number, line in enumerate(lines, start=1):
+            if self.max_line_length is not None and \
+                                        len(line) > self.max_line_length:
+                raise LimitExceeded('max_line_length', self.max_line_length,
+                                    line_number)
+            self.step(line_number)
+            yield line
+
+    def check_depth(self, depth, line_number):
+        if self.max_depth is not None and depth > self.max_depth:
+            raise LimitExceeded('max_depth', self.max_depth, line_number)
+
+
+def iterate_chunk_lines(chunks, encoding='utf-8'):
+    """
+    Iterate the lines of an iterable of str or bytes chunks, decoding the
+    bytes incrementally.
+    """
+    bytes_decoder = codecs.getincrementaldecoder(encoding)()
+    # Like a file opened in text mode, translate all the newlines to "\n"
+    decoder = io.IncrementalNewlineDecoder(None, translate=True)
+    pending = ''
+    for chunk in chunks:
+        # The decoders keep the incomplete characters and "\r" at the end of
+        #  a chunk until the next one
+        if not isinstance(chunk, str):
+            chunk = bytes_decoder.decode(chunk)
+        lines = decoder.decode(chunk).split('\n')
+        if len(lines) > 1:
+            yield pending + lines[0] + '\n'
+            for line in lines[1:-1]:
+                yield line + '\n'
+            pending = lines[-1]
+        else:
+            pending += lines[0]
+    pending += decoder.decode(bytes_decoder.decode(b'', final=True),
+                              final=True)
+    lines = pending.split('\n')
+    for line in lines[:-1]:
+        yield line + '\n'
+    if lines[-1]:
+        yield lines[-1]
+
+
+def iterate_buffer_lines(buffer, encoding='utf-8', chunk_size=1 << 16):
+    """
+    Iterate the lines of a bytes-like object, for example an mmap object,
+    decoding it incrementally.
+    """
+    return iterate_chunk_lines((buffer[start:start + chunk_size]
+                                for start in range(0, len(buffer),
+                                                   chunk_size)), encoding)
+
+
 class Stream:
     """
     The document stream.
     """
+    __slots__ = ('stream', 'rewound_lines', 'line_number', 'lines_buffer',
+                 'element_line_number')
+
     def __init__(self, stream):
         self.stream = stream
+        # The rewound lines are kept in reverse order, so that the next one
+        #  can be popped from the end; chaining a new iterator for every
+        #  rewind would instead make each read slower
+        self.rewound_lines = []
+        # The number of the next line in the source, starting from 1; every
+        #  rewound line is assumed to replace a line that was read
+        self.line_number = 1
+        # The line where the block element being looked for starts
+        self.element_line_number = 1
 
     def read_next_line(self):
         # Do *not* use this method without protecting it from StopIteration
         #   and properly rewinding the parsed lines in case they aren't used!!!
         #  If possible, don't use this method at all (just rely on the core
         #   engine
-        return next(self.stream)
+        if self.rewound_lines:
+            line = self.rewound_lines.pop()
+        else:
+            line = next(self.stream)
+        self.line_number += 1
+        return line
 
     def read_next_lines_buffered(self, N):
         # Do *not* use this method without protecting it from StopIteration
@@ -72,31 +255,102 @@ class Stream:
             self.lines_buffer.append(self.read_next_line())
         return self.lines_buffer
 
+    def read_more_lines_buffered(self, N):
+        # Do *not* use this method without protecting it from StopIteration
+        #   and properly rewinding the parsed lines in case they aren't used!!!
+        # The lines are appended to the current buffer, so that rewind_buffer
+        #  still rewinds all the lines read since read_next_lines_buffered
+        for n in range(N):
+            self.lines_buffer.append(self.read_next_line())
+        return self.lines_buffer
+
     def rewind_lines(self, *lines):
-        self.stream = itertools.chain(lines, self.stream)
+        self.rewound_lines.extend(reversed(lines))
+        self.line_number -= len(lines)
 
     def rewind_buffer(self):
         self.rewind_lines(*self.lines_buffer)
 
 
-class RawText:
+class ContainerStack:
     """
-    The content of an element.
+    The chain of the open block containers, from the root to the innermost
+    one, with their internal indentations.
     """
-    def __init__(self, text):
-        self.text = text
+    __slots__ = ('containers', 'indentations')
 
-    def append(self, text):
-        self.text = ''.join((self.text, text))
+    def __init__(self):
+        self.containers = []
+        self.indentations = []
+
+    def push(self, container):
+        # The index of a container in the stack is its depth, and the stack
+        #  below it is always the chain of its ancestors
+        if container.parent is not None:
+            self._synchronize(container.parent)
+        del self.containers[container.depth:]
+        del self.indentations[container.depth:]
+        self.containers.append(container)
+        self.indentations.append(container.indentation_internal)
+
+    def _synchronize(self, container):
+        try:
+            if self.containers[container.depth] is container:
+                return
+        except IndexError:
+            pass
+        # The stack doesn't end with the chain of the container, e.g. because
+        #  a previous sibling quote block has been continued: rebuild it
+        chain = []
+        while container is not None:
+            chain.append(container)
+            container = container.parent
+        chain.reverse()
+        self.containers[:] = chain
+        self.indentations[:] = [container.indentation_internal
+                                for container in chain]
+
+    def find_parent(self, parent, indentation):
+        # Return the innermost container, among parent and its ancestors,
+        #  whose internal indentation is not greater than indentation
+        self._synchronize(parent)
+        # The internal indentations never decrease from the root to the
+        #  innermost container, so a binary search is enough
+        return self.containers[bisect.bisect_right(self.indentations,
+                                            indentation, 0, parent.depth + 1)
+                               - 1]
+
+
+class _Text:
+    """
+    Base class for the text content of elements.
+    """
+    __slots__ = ()
 
     def get_raw_text(self):
         return self.text
 
-    def convert_to_html(self):
-        # "&" must be escaped *before* everything else
-        text = self.text.replace('&', '&amp;')
-        text = text.replace('<', '&lt;')
-        return text
+    def convert_to_html(self, escaper):
+        # Text nodes don't reference their document, so the elements pass the
+        #  HtmlEscaper of their Langmark object
+        return escaper.escape(self.text)
+
+    def convert_to_text(self, escaper=None):
+        return self.text
+
+
+class RawText(_Text):
+    """
+    The content of an element.
+    """
+    __slots__ = ('text', )
+
+    def __init__(self, text):
+        self.text = text
+
+    def append(self, text, line_number=None):
+        # line_number is only used by SourceText
+        self.text = ''.join((self.text, text))
 
     @staticmethod
     def compute_equivalent_indentation(line):
@@ -123,3 +377,125 @@ class RawText:
                 return ' ' * (current_indentation - indentation - 1) + line[
                                                                 indentation:]
         return line
+
+
+class SourceText(_Text):
+    """
+    The content of an element, kept as a list of chunks that are joined only
+    when needed, together with the source line number of each of its lines;
+    used while validating.
+    """
+    __slots__ = ('chunks', 'joined_text', 'length', 'line_offsets',
+                 'line_numbers')
+
+    def __init__(self, text):
+        self.chunks = []
+        self.joined_text = ''
+        self.length = 0
+        # The offset in the text and the source line number of every line
+        self.line_offsets = array.array('l')
+        self.line_numbers = array.array('l')
+        self.append(text)
+
+    def append(self, text, line_number=0):
+        start = 0
+        while start < len(text):
+            self.line_offsets.append(self.length + start)
+            self.line_numbers.append(line_number)
+            line_number += 1
+            start = text.find('\n', start) + 1 or len(text)
+        self.chunks.append(text)
+        self.length += len(text)
+
+    @property
+    def text(self):
+        if self.chunks:
+            self.chunks.insert(0, self.joined_text)
+            self.joined_text = ''.join(self.chunks)
+            self.chunks = []
+        return self.joined_text
+
+    def get_position(self, offset):
+        # Return the source line number of the character at offset, and its
+        #  column in the line after stripping the element's indentation
+        index = bisect.bisect_right(self.line_offsets, offset) - 1
+        if index < 0:
+            return (None, None)
+        return (self.line_numbers[index], offset - self.line_offsets[index])
+
+
+class RawTextFactory:
+    """
+    Makes the text nodes of the inline elements of a block as RawText objects.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def _append(children, text):
+        # Merge consecutive text fragments (e.g. around escapes and rejected
+        #  marks) into a single node; an empty node is still appended to an
+        #  empty list, since the inline elements test whether they are at the
+        #  start of their parent from its children
+        if children:
+            last = children[-1]
+            if last.__class__ is RawText:
+                if text:
+                    last.text = ''.join((last.text, text))
+                return
+        children.append(RawText(text))
+
+    def add_text(self, children, event):
+        self._append(children, event.parsed_text)
+
+    def add_marked_text(self, children, event):
+        self._append(children, ''.join((event.parsed_text,
+                                        event.mark.group())))
+
+    def add_escaped_text(self, children, event):
+        self._append(children, event.parsed_text + event.mark.group()[1])
+
+    def add_remainder_text(self, children, event):
+        self._append(children, event.remainder_text)
+
+    def make_mark_text(self, parsed_text, mark):
+        return RawText(mark.group())
+
+
+class LimitedTextFactory:
+    """
+    Wraps the text factory of a block to count its inline marks, since every
+    mark handler calls exactly one of its add_*text methods.
+    """
+    __slots__ = ('factory', 'limits', 'line_number', 'marks')
+
+    def __init__(self, factory, limits, line_number):
+        self.factory = factory
+        self.limits = limits
+        self.line_number = line_number
+        self.marks = 0
+
+    def _count_mark(self):
+        self.marks += 1
+        if self.limits.max_inline_marks is not None and \
+                                self.marks > self.limits.max_inline_marks:
+            raise LimitExceeded('max_inline_marks',
+                                self.limits.max_inline_marks, self.line_number)
+        self.limits.step(self.line_number)
+
+    def add_text(self, children, event):
+        self._count_mark()
+        self.factory.add_text(children, event)
+
+    def add_marked_text(self, children, event):
+        self._count_mark()
+        self.factory.add_marked_text(children, event)
+
+    def add_escaped_text(self, children, event):
+        self._count_mark()
+        self.factory.add_escaped_text(children, event)
+
+    def add_remainder_text(self, children, event):
+        self.factory.add_remainder_text(children, event)
+
+    def make_mark_text(self, parsed_text, mark):
+        return self.factory.make_mark_text(parsed_text, mark)
@@ -0,0 +1,184 @@
+# Langmark - A powerful and extensible lightweight markup language.
+# Copyright (C) 2015 Dario Giovannetti <dev@dariogiovannetti.net>
+#
+# This file is part of Langmark.
+#
+# Langmark is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Langmark is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from .base import Configuration
+from .html import HTMLInlineTag, HTMLInlineComment
+
+
+class Diagnostic:
+    """
+    A problem found in a document.
+    """
+    __slots__ = ('line_number', 'message')
+
+    def __init__(self, line_number, message):
+        self.line_number = line_number
+        self.message = message
+
+    def __str__(self):
+        return 'line {}: {}'.format(self.line_number, self.message)
+
+
+class Validator:
+    """
+    Collects the data needed to report the problems of a document while it's
+    parsed by Langmark.validate.
+    """
+    __slots__ = ('header_key_lines', 'link_references', 'open_fences')
+    # Link targets that aren't defined ids are only reported if they don't
+    #  look like URLs or paths; only the last letter of a scheme is looked
+    #  for, so that searching a long id stays linear
+    URL_LIKE = re.compile(r'[a-z][0-9+.\-]*:|[/.#?]', re.IGNORECASE)
+    # Validating doesn't parse the inline elements: the links are found by
+    #  scanning these marks once, skipping the escaped characters, the plain
+    #  code and text and the HTML tags and comments; the start and end rules
+    #  of the marks are the same as marks._InlineMarkStartParametersEnd, so
+    #  the links found only differ from the parsed ones in degenerate cases,
+    #  e.g. overlapping marks
+    SCAN_MARKS = re.compile(r'`.|<|\[+|\]+|#+|\\+')
+    ESCAPE = re.compile(r'`(.)')
+    PARAMETER_MARK_NORMAL = r'(?<![|`])\|{{{}}}(?!\|)'
+    PARAMETER_MARK_SPACED = r'(?:^|[ \t])\|{{{}}}(?:[ \t]|$)'
+    END_CHARS = {'[': ']', '#': '#', '\\': '\\'}
+
+    def __init__(self):
+        self.header_key_lines = {}
+        self.link_references = []
+        # Elements started by a full-line mark whose end mark wasn't found
+        self.open_fences = {}
+
+    def add_header_key(self, key, line_number):
+        self.header_key_lines.setdefault(key, []).append(line_number)
+
+    @staticmethod
+    def _test_start_mark(text, match):
+        # Return None if the mark can't start an element, otherwise whether
+        #  its marks are spaced
+        mark = match.group()
+        post_char = text[match.end():match.end() + 1]
+        if post_char in ('', '\n') or (mark[0] == '[' and
+                                       len(mark) > Configuration.MARK_LIMIT):
+            return None
+        if post_char not in (' ', '\t'):
+            return False
+        pre_char = text[match.start() - 1:match.start()]
+        if len(mark) < 2 or pre_char not in ('', ' ', '\t', '\n'):
+            return None
+        return True
+
+    def scan_links(self, langmark_, rawtext):
+        # rawtext is the base.SourceText of a block containing inline elements
+        text = rawtext.text
+        # The end mark being looked for, the offset where the content of the
+        #  open link starts (None for plain code) and whether its marks are
+        #  spaced
+        end_mark = None
+        offset = 0
+        while True:
+            match = self.SCAN_MARKS.search(text, offset)
+            if match is None:
+                break
+            offset = match.end()
+            mark = match.group()
+            if mark[0] == '`':
+                continue
+            if mark == '<':
+                # The content of links and plain code and text isn't parsed
+                if end_mark is None:
+                    offset = self._skip_html(text, match.start(), offset)
+                continue
+            if end_mark is None:
+                if mark[0] == ']':
+                    continue
+                spaced = self._test_start_mark(text, match)
+                if spaced is None:
+                    continue
+                end_mark = self.END_CHARS[mark[0]] * len(mark)
+                # Spaced marks include the space after the start mark
+                start = match.end() + int(spaced) if mark[0] == '[' else None
+            elif mark == end_mark:
+                pre_char = text[match.start() - 1:match.start()]
+                if pre_char == '\n' or spaced != (pre_char in (' ', '\t')):
+                    continue
+                if start is not None:
+                    # and the space before the end mark
+                    self._add_link(langmark_, text[start:match.start() -
+                                   int(spaced)], len(mark), spaced,
+                                   rawtext.get_position(start)[0])
+                end_mark = None
+        if end_mark is not None and start is not None:
+            # Like the inline parser, end the open link at the end of the text
+            self._add_link(langmark_, text[start:], len(end_mark), spaced,
+                           rawtext.get_position(start)[0])
+
+    @staticmethod
+    def _skip_html(text, start, offset):
+        # Return the offset after the HTML tag or comment starting at start,
+        #  or offset if there's none; like the inline parser, an unclosed
+        #  comment takes the rest of the text
+        if HTMLInlineComment.INLINE_MARK.start.match(text, start):
+            end = HTMLInlineComment.INLINE_MARK.end.search(text, start + 4)
+            return len(text) if end is None else end.end()
+        tag = HTMLInlineTag.INLINE_MARK.start.match(text, start)
+        return offset if tag is None else tag.end()
+
+    def _add_link(self, langmark_, content, length, spaced, line_number):
+        parameter_mark = (self.PARAMETER_MARK_SPACED if spaced else
+                          self.PARAMETER_MARK_NORMAL).format(length)
+        parameters = [self.ESCAPE.sub(r'\1', parameter) for parameter in
+                      re.split(parameter_mark, content, flags=re.MULTILINE)]
+        if len(parameters) > 2:
+            langmark_.links.add_id(parameters[1], parameters[2],
+                                   parameters[3] if len(parameters) > 3
+                                   else None, line_number)
+        else:
+            self.link_references.append((parameters[-1], line_number))
+
+    def open_fence(self, element, line_number):
+        self.open_fences[element] = line_number
+
+    def close_fence(self, element):
+        del self.open_fences[element]
+
+    def get_diagnostics(self, links):
+        # links is the links.LinksData of the document
+        diagnostics = []
+        for key, line_numbers in self.header_key_lines.items():
+            for line_number in line_numbers[1:]:
+                diagnostics.append(Diagnostic(
+                    line_number, 'duplicated header key "{}" (first defined '
+                    'at line {})'.format(key, line_numbers[0])))
+        for id_, line_numbers in links.duplicate_ids.items():
+            for line_number in line_numbers:
+                diagnostics.append(Diagnostic(
+                    line_number, 'duplicated link id "{}" (first defined at '
+                    'line {})'.format(id_, links.id_to_line.get(id_))))
+        for id_, line_number in self.link_references:
+            try:
+                links.get_url(id_)
+            except ValueError:
+                if not self.URL_LIKE.search(id_):
+                    diagnostics.append(Diagnostic(
+                        line_number, 'undefined link id "{}"'.format(id_)))
+        for element, line_number in self.open_fences.items():
+            diagnostics.append(Diagnostic(
+                line_number, 'unclosed {}'.format(element.__class__.__name__)))
+        # Diagnostics without a line number go first
+        diagnostics.sort(key=lambda diagnostic: diagnostic.line_number or 0)
+        return diagnostics
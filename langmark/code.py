@@ -17,10 +17,8 @@
 # along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
 
 from . import (marks, elements)
-from .base import RawText
-from .factories import _BlockNotIndentedElementFactory
-from .exceptions import (_BlockElementStartNotMatched,
-                         _BlockElementStartConsumed,
+from .factories import _BlockMarksElementFactory
+from .exceptions import (_BlockElementStartConsumed,
                          _BlockElementStartMatched,
                          _BlockElementContinue,
                          _BlockElementEndConsumed,
@@ -35,6 +33,7 @@ class FormattableCodeInline(elements._InlineElementContainingInline):
 
         |code|
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableSimple('|')
     HTML_TAGS = ('<code>', '</code>')
 
@@ -45,6 +44,7 @@ class PlainCodeInline(elements._InlineElementContainingHtmlText):
 
         #code#
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkNonEscapableSimple('#')
     HTML_TAGS = ('<code>', '</code>')
 
@@ -55,6 +55,7 @@ class PlainTextInline(elements._InlineElementContainingRawText):
 
         \text\
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkNonEscapableSimple('\\')
     HTML_TAGS = ('<span>', '</span>')
 
@@ -67,6 +68,7 @@ class FormattableCodeBlock(elements._BlockElementContainingInline_LineMarks):
         Formatted code
         |||
     """
+    __slots__ = ()
     HTML_TAGS = ('<pre>', '</pre>')
 
 
@@ -77,6 +79,7 @@ class FormattableCodeBlockIndented(
 
         Formatted code
     """
+    __slots__ = ()
     HTML_TAGS = ('<pre>', '</pre>')
 
 
@@ -88,6 +91,7 @@ class PlainCodeBlock(elements._BlockElementContainingText_LineMarks):
         Plain code
         ###
     """
+    __slots__ = ()
     HTML_TAGS = ('<pre>', '</pre>')
 
 
@@ -97,6 +101,7 @@ class PlainCodeBlockIndented(elements._BlockElementContainingText_Indented):
 
         Plain code
     """
+    __slots__ = ()
     HTML_TAGS = ('<pre>', '</pre>')
 
 
@@ -108,31 +113,21 @@ class PlainTextBlock(elements._BlockElementContainingRaw_LineMarks):
         Plain text
         \\\
     """
-    pass
+    __slots__ = ()
 
 
-class CodeElements(_BlockNotIndentedElementFactory):
+class CodeElements(_BlockMarksElementFactory):
     """
     Factory for code elements.
     """
     TEST_START_LINES = 1
+    REORDERABLE = True
     ELEMENTS = {
         FormattableCodeBlock: marks.BlockMarkSimple('|'),
         PlainCodeBlock: marks.BlockMarkSimple('#'),
         PlainTextBlock: marks.BlockMarkSimple('\\'),
     }
 
-    def _find_equivalent_indentation(self, langmark_, lines):
-        for Element in self.ELEMENTS:
-            mark = self.ELEMENTS[Element]
-            match = mark.start.fullmatch(lines[0])
-            if match:
-                break
-        else:
-            raise _BlockElementStartNotMatched()
-        indentation = RawText.compute_equivalent_indentation(match.group(1))
-        return (indentation, (match, ), Element)
-
     def _do_find_element(self, langmark_, parent, lines, indentation, matches,
                          Element):
         mark = self.ELEMENTS[Element]
@@ -0,0 +1,174 @@
+# Langmark - A powerful and extensible lightweight markup language.
+# Copyright (C) 2015 Dario Giovannetti <dev@dariogiovannetti.net>
+#
+# This file is part of Langmark.
+#
+# Langmark is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Langmark is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+from .base import RawText
+
+
+class CompactTree:
+    """
+    The elements tree stored as parallel arrays of node attributes, instead
+    of an object per element.
+    """
+    __slots__ = ('langmark', 'classes', 'class_to_kind', 'kinds', 'parents',
+                 'first_children', 'next_siblings', 'texts', 'text_indices',
+                 'attributes', 'last_root_child')
+
+    def __init__(self, langmark_, Root):
+        self.langmark = langmark_
+        # The kind of a node is the index of its class in self.classes
+        self.classes = []
+        self.class_to_kind = {}
+        self.kinds = array.array('H')
+        self.parents = array.array('l')
+        self.first_children = array.array('l')
+        self.next_siblings = array.array('l')
+        # The text of a node (the content of text nodes, or the raw text of
+        #  block elements) is one of the strings in self.texts
+        self.texts = []
+        self.text_indices = array.array('l')
+        # Only the elements that define COMPACT_ATTRIBUTES have an entry here
+        self.attributes = {}
+        self._add_node(Root, -1)
+        self.last_root_child = -1
+
+    def _add_node(self, Class, parent_index):
+        try:
+            kind = self.class_to_kind[Class]
+        except KeyError:
+            kind = self.class_to_kind[Class] = len(self.classes)
+            self.classes.append(Class)
+        self.kinds.append(kind)
+        self.parents.append(parent_index)
+        self.first_children.append(-1)
+        self.next_siblings.append(-1)
+        self.text_indices.append(-1)
+        return len(self.kinds) - 1
+
+    def _set_text(self, index, text):
+        self.text_indices[index] = len(self.texts)
+        self.texts.append(text.get_raw_text())
+
+    def append_child(self, element):
+        """
+        Store element and its descendants as the last child of the root node.
+        """
+        # Use a stack instead of recursing, so that the depth of the tree is
+        #  not limited by the maximum recursion depth
+        stack = [(element, 0)]
+        last_children = {0: self.last_root_child}
+        while stack:
+            node, parent_index = stack.pop()
+            if isinstance(node, RawText):
+                index = self._add_node(RawText, parent_index)
+                self._set_text(index, node)
+            else:
+                index = self._add_node(node.__class__, parent_index)
+                if node.STORE_RAWTEXT:
+                    self._set_text(index, node.rawtext)
+                if node.COMPACT_ATTRIBUTES:
+                    self.attributes[index] = tuple(getattr(node, name) for
+                                                   name in
+                                                   node.COMPACT_ATTRIBUTES)
+                stack.extend((child, index) for child in
+                             reversed(node.children))
+            previous = last_children.get(parent_index, -1)
+            if previous == -1:
+                self.first_children[parent_index] = index
+            else:
+                self.next_siblings[previous] = index
+            last_children[parent_index] = index
+        self.last_root_child = last_children[0]
+
+    def get_text(self, index):
+        text_index = self.text_indices[index]
+        if text_index == -1:
+            return None
+        return self.texts[text_index]
+
+    def iter_child_indices(self, index):
+        child = self.first_children[index]
+        while child != -1:
+            yield child
+            child = self.next_siblings[child]
+
+    def get_root(self):
+        return self.get_element(0)
+
+    def get_element(self, index):
+        """
+        Return a proxy for the node at index: an element of the node's class
+        whose children are only created when accessed.
+        """
+        # Instantiate the ancestors first, without recursing
+        ancestors = []
+        parent_index = self.parents[index]
+        while parent_index != -1:
+            ancestors.append(parent_index)
+            parent_index = self.parents[parent_index]
+        parent = None
+        for ancestor in reversed(ancestors):
+            parent = self._make_proxy(ancestor, parent)
+        return self._make_proxy(index, parent)
+
+    def _make_proxy(self, index, parent):
+        Class = self.classes[self.kinds[index]]
+        if Class is RawText:
+            return RawText(self.get_text(index))
+        # Skip __init__, which would start parsing
+        element = Class.__new__(Class)
+        element.langmark = self.langmark
+        element.parent = parent
+        element.children = CompactChildren(self, index, element)
+        text = self.get_text(index)
+        if text is not None:
+            element.rawtext = RawText(text)
+        try:
+            values = self.attributes[index]
+        except KeyError:
+            pass
+        else:
+            for name, value in zip(Class.COMPACT_ATTRIBUTES, values):
+                setattr(element, name, value)
+        return element
+
+
+class CompactChildren:
+    """
+    A read-only sequence of the children of a CompactTree node, which creates
+    their proxies on access without keeping them.
+    """
+    __slots__ = ('tree', 'indices', 'parent')
+
+    def __init__(self, tree, index, parent):
+        self.tree = tree
+        self.indices = array.array('l', tree.iter_child_indices(index))
+        self.parent = parent
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.tree._make_proxy(index, self.parent)
+                    for index in self.indices[key]]
+        return self.tree._make_proxy(self.indices[key], self.parent)
+
+    def __iter__(self):
+        for index in self.indices:
+            yield self.tree._make_proxy(index, self.parent)
@@ -18,8 +18,9 @@
 
 import re
 import textparser
-from . import marks
-from .base import Configuration, RawText
+from . import marks, serialization
+from .base import (Configuration, _Text, RawText, SourceText,
+                   RawTextFactory, LimitedTextFactory)
 from .exceptions import (_BlockElementStartNotMatched,
                          _BlockElementStartConsumed,
                          _BlockElementStartMatched,
@@ -27,19 +28,98 @@ from .exceptions import (_BlockElementStartNotMatched,
                          _BlockElementEndConsumed,
                          _BlockElementEndNotConsumed,
                          _InlineElementStartNotMatched,
-                         _EndOfFile)
+                         _EndOfFile,
+                         SerializationError)
+
+
+class ElementIndex:
+    """
+    The elements of a document grouped by class, in the order they were
+    created while parsing.
+    """
+    __slots__ = ('class_to_elements', )
+
+    def __init__(self):
+        self.class_to_elements = {}
+
+    def add(self, element):
+        try:
+            self.class_to_elements[element.__class__].append(element)
+        except KeyError:
+            self.class_to_elements[element.__class__] = [element]
+
+    def find(self, Class):
+        # Also the elements of the subclasses of Class, grouped by class
+        for IndexedClass, elements in self.class_to_elements.items():
+            if issubclass(IndexedClass, Class):
+                yield from elements
 
 
 class _Element:
     """
     Base class for document elements.
     """
+    __slots__ = ('langmark', 'parent', 'children')
     HTML_BREAK = '\n'
+    # Separates the text of sibling block elements in convert_to_text
+    TEXT_BREAK = '\n\n'
+    # Elements that never get their own children list share an empty tuple
+    HAS_CHILDREN = True
+    # The attributes, other than the children and the raw text, that
+    #  compact.CompactTree must store to convert the element
+    COMPACT_ATTRIBUTES = ()
+    # Whether compact.CompactTree and dumps must store the raw text of the
+    #  element, i.e. it isn't fully represented by its children
+    STORE_RAWTEXT = False
+    # Whether the elements of the class are added to the ElementIndex
+    INDEXED = True
 
     def __init__(self, langmark_, parent):
         self.langmark = langmark_
         self.parent = parent
-        self.children = []
+        self.children = [] if self.HAS_CHILDREN else ()
+        if langmark_.element_index is not None and self.INDEXED:
+            langmark_.element_index.add(self)
+
+    def iterate_preorder(self):
+        """
+        Yield the element and all its descendants, including the text nodes,
+        each before its children.
+        """
+        # Don't recurse, see convert_to_html
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if not isinstance(node, _Text):
+                stack.extend(reversed(node.children))
+
+    def iterate_postorder(self):
+        """
+        Yield all the descendants of the element, including the text nodes,
+        and then the element itself, each after its children.
+        """
+        stack = [(self, iter(self.children))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if isinstance(child, _Text):
+                    yield child
+                else:
+                    stack.append((child, iter(child.children)))
+                    break
+            else:
+                stack.pop()
+                yield node
+
+    def iterate_by_class(self, Class):
+        """
+        Yield the element and its descendants that are instances of Class, in
+        pre-order.
+        """
+        for node in self.iterate_preorder():
+            if isinstance(node, Class):
+                yield node
 
     def read_lines(self, N):
         try:
@@ -47,6 +127,12 @@ class _Element:
         except StopIteration:
             raise _EndOfFile()
 
+    def read_more_lines(self, N):
+        try:
+            return self.langmark.stream.read_more_lines_buffered(N)
+        except StopIteration:
+            raise _EndOfFile()
+
     def read_lines_buffer(self):
         return self.langmark.stream.lines_buffer
 
@@ -62,6 +148,49 @@ class _Element:
     def convert_to_html(self):
         # TODO: Convert to HTML *while* building the tree, not afterwards
         #       (use events?)
+        return self._convert('convert_to_html', 'join_children_html',
+                             self.langmark.escaper)
+
+    def convert_to_text(self):
+        # Only the visible text, without markup and escaping, e.g. for
+        #  indexing the document
+        return self._convert('convert_to_text', 'join_children_text', None)
+
+    def _convert(self, method_name, join_method_name, escaper):
+        # Don't recurse, otherwise deeply nested elements would raise
+        #  "RecursionError: maximum recursion depth exceeded"; the children
+        #  that also use this method are converted with an explicit stack, the
+        #  others (text, leaf elements or elements of extensions that
+        #  override method_name) are converted directly; escaper is passed to
+        #  the text nodes
+        method = getattr(_Element, method_name)
+        converted = []
+        stack = [(self, iter(self.children), [])]
+        while stack:
+            element, children, children_converted = stack[-1]
+            for child in children:
+                if isinstance(child, _Text):
+                    children_converted.append(getattr(child, method_name)(
+                                                                    escaper))
+                    continue
+                if getattr(child.__class__, method_name) is method:
+                    stack.append((child, iter(child.children), []))
+                    break
+                children_converted.append(getattr(child, method_name)())
+            else:
+                stack.pop()
+                result = getattr(element, join_method_name)(
+                                                        children_converted)
+                (stack[-1][2] if stack else converted).append(result)
+        return converted[0]
+
+    def join_children_html(self, children_html):
+        # Elements that don't override convert_to_html must implement this
+        #  method, which receives the HTML of their children
+        raise NotImplementedError()
+
+    def join_children_text(self, children_text):
+        # Likewise for convert_to_text
         raise NotImplementedError()
 
 
@@ -69,6 +198,7 @@ class _BlockElement(_Element):
     """
     Base class for block elements.
     """
+    __slots__ = ('indentation_external', 'indentation_internal')
     TEST_END_LINES = None
     HTML_TAGS = ('<div>', '</div>')
 
@@ -90,15 +220,40 @@ class _BlockElementContainingBlock(_BlockElement):
     """
     Base class for elements containing block elements.
     """
-    INSTALLED_BLOCK_FACTORIES = None
+    __slots__ = ('depth', 'line_preprocessor')
+
+    def __init__(self, langmark_, parent, indentation_external,
+                 indentation_internal, initial_lines):
+        if parent is None:
+            self.depth = 0
+            self.line_preprocessor = None
+        else:
+            self.depth = parent.depth + 1
+            # The lines of the descendant elements are preprocessed by the
+            #  innermost container that defines preprocess_inline
+            self.line_preprocessor = parent.line_preprocessor
+        try:
+            self.line_preprocessor = self.preprocess_inline
+        except AttributeError:
+            pass
+        if langmark_.limits is not None:
+            langmark_.limits.check_depth(self.depth,
+                                         langmark_.stream.line_number - 1)
+        _BlockElement.__init__(self, langmark_, parent, indentation_external,
+                               indentation_internal, initial_lines)
+        langmark_.container_stack.push(self)
 
     def _process_initial_lines(self, lines):
         self.rewind_lines(*lines)
 
     def find_element_start(self):
         while True:
+            # The factories rewind the lines that they don't match, so this is
+            #  also the first line of the element that will be found
+            stream = self.langmark.stream
+            stream.element_line_number = stream.line_number
             try:
-                for factory in self.INSTALLED_BLOCK_FACTORIES:
+                for factory in self.langmark.block_factories:
                     # Note how factory.make_element returns the element
                     #  by raising _BlockElementStartMatched
                     factory.make_element(self.langmark, self)
@@ -146,7 +301,7 @@ class _BlockElementContainingBlock(_BlockElement):
                 #  "RuntimeError: maximum recursion depth exceeded while
                 #  calling a Python object" for long documents
                 while True:
-                    self.children.append(element)
+                    self.append_child(element)
                     try:
                         element.parse_next_line()
                     except _BlockElementEndConsumed:
@@ -173,10 +328,13 @@ class _BlockElementContainingBlock(_BlockElement):
             else:
                 raise _BlockElementStartMatched(element)
 
-    def convert_to_html(self):
-        html = self.HTML_BREAK.join(child.convert_to_html()
-                                    for child in self.children)
-        if len(self.children) > 1:
+    def append_child(self, element):
+        # Root overrides this method
+        self.children.append(element)
+
+    def join_children_html(self, children_html):
+        html = self.HTML_BREAK.join(children_html)
+        if len(children_html) > 1:
             # TODO: Re-add the indentation before the tags
             return self.HTML_BREAK.join((self.HTML_TAGS[0], html,
                                          self.HTML_TAGS[1]))
@@ -184,11 +342,21 @@ class _BlockElementContainingBlock(_BlockElement):
             # self.children should never be empty, but still support the case
             return html.join(self.HTML_TAGS)
 
+    def join_children_text(self, children_text):
+        # Skip the elements without text, e.g. horizontal rules
+        return self.TEXT_BREAK.join(text for text in children_text if text)
+
 
 class Root(_BlockElementContainingBlock):
     """
     The root element of the tree.
     """
+    __slots__ = ()
+    # The Langmark class installs the element classes that can be dumped and
+    #  loaded, and the meta elements serialized with the tree
+    SERIALIZABLE_ELEMENTS = None
+    META_ELEMENTS = None
+
     def __init__(self, langmark_):
         _BlockElementContainingBlock.__init__(self, langmark_, None, 0, 0, ())
 
@@ -199,16 +367,122 @@ class Root(_BlockElementContainingBlock):
             # _EndOfFile can be raised (and left uncaught) by Paragraph, for
             #  example if a document ends with a metadata element
             pass
-
-    def convert_to_html(self):
-        return self.HTML_BREAK.join(child.convert_to_html()
-                                    for child in self.children)
+        self.langmark.sections.close()
+        if self.children:
+            self._complete_child()
+
+    def append_child(self, element):
+        if self.children:
+            # The previous child can only be processed when its next sibling
+            #  is appended, since list items still update their previous
+            #  sibling when they are created
+            self._complete_child()
+        # The sections are indexed in the same pass
+        self.langmark.sections.add_child(element,
+                                    self.langmark.stream.element_line_number)
+        self.children.append(element)
+
+    def _complete_child(self):
+        # Process the last child, whose parsing is complete
+        if self.langmark.pipeline is not None:
+            self.langmark.pipeline.run(self.children[-1])
+        if self.langmark.compact_tree is not None:
+            self.langmark.compact_tree.append_child(self.children.pop())
+        elif self.langmark.validator is not None:
+            # Validating doesn't need the tree
+            self.children.pop()
+
+    def join_children_html(self, children_html):
+        if self.langmark.section_divs:
+            children_html = self.langmark.sections.wrap_html(children_html)
+        return self.HTML_BREAK.join(children_html)
+
+    def iterate_html(self):
+        # The concatenation of the chunks is the output of convert_to_html
+        children_html = (child.convert_to_html() for child in self.children)
+        if self.langmark.section_divs:
+            children_html = self.langmark.sections.wrap_html(children_html)
+        separator = ''
+        for html in children_html:
+            yield separator + html
+            separator = self.HTML_BREAK
+
+    def get_element(self, path):
+        """
+        Return the element at path, a sequence of child indices starting from
+        the root element.
+        """
+        element = self
+        for index in path:
+            element = element.children[index]
+        return element
+
+    def convert_range_to_html(self, start, end=None):
+        """
+        Convert only the children of the root element from start to end
+        (excluded); link ids are still resolved in the whole document.
+        """
+        return self.HTML_BREAK.join(child.convert_to_html() for child in
+                                    self.children[start:end])
+
+    def convert_section_to_html(self, anchor):
+        """
+        Convert only the section of the heading with anchor.
+        """
+        section = self.langmark.sections.get_section(anchor)
+        children_html = (child.convert_to_html() for child in
+                         self.children[section.start:section.end])
+        if self.langmark.section_divs:
+            children_html = self.langmark.sections.wrap_html(children_html,
+                                                    (section, ), section.start)
+        return self.HTML_BREAK.join(children_html)
+
+    def convert_lines_to_html(self, first, last):
+        """
+        Convert only the children of the root element that overlap the source
+        lines from first to last (included).
+        """
+        return self.convert_range_to_html(
+                            *self.langmark.sections.find_lines(first, last))
+
+    def iterate_text(self):
+        # The concatenation of the chunks is the output of convert_to_text
+        separator = ''
+        for child in self.children:
+            text = child.convert_to_text()
+            if text:
+                yield separator + text
+                separator = self.TEXT_BREAK
+
+    def dump(self, stream):
+        """
+        Write the tree and the meta data of the document to a binary stream.
+        """
+        writer = serialization.TreeWriter(self.SERIALIZABLE_ELEMENTS,
+                                          self.META_ELEMENTS)
+        writer.add_tree(self)
+        writer.write(self.langmark, stream)
+
+    @classmethod
+    def load(cls, langmark_, stream):
+        """
+        Read a tree written by dump from a binary stream, also restoring the
+        meta data of langmark_, and return its root.
+        """
+        root = serialization.TreeReader(cls.SERIALIZABLE_ELEMENTS,
+                                        cls.META_ELEMENTS, stream
+                                        ).read(langmark_)
+        if root.__class__ is not cls:
+            raise SerializationError('the root node is not a {}'.format(
+                                                                cls.__name__))
+        return root
 
 
 class IndentedContainer(_BlockElementContainingBlock):
     """
     An indented block container.
     """
+    __slots__ = ()
     HTML_TAGS = ('<div class="langmark-indented">', '</div>')
 
 
@@ -217,9 +491,11 @@ class _BlockElementContainingBlock_PrefixGrouped(_BlockElementContainingBlock):
     Base class for block elements identified by a prefix that must be grouped
     inside an additional HTML element.
     """
+    __slots__ = ('group_item_number', 'group_item_last')
     # TODO: This class should be made a mixin, but it's hard because of the
     #       super calls
     HTML_OUTER_TAGS = None
+    COMPACT_ATTRIBUTES = ('group_item_number', 'group_item_last')
 
     def __init__(self, langmark_, parent, indentation_external,
                  indentation_internal, initial_lines):
@@ -237,9 +513,9 @@ class _BlockElementContainingBlock_PrefixGrouped(_BlockElementContainingBlock):
                 self.group_item_number = previous.group_item_number + 1
                 previous.group_item_last = False
 
-    def convert_to_html(self):
+    def join_children_html(self, children_html):
         html = super(_BlockElementContainingBlock_PrefixGrouped,
-                     self).convert_to_html()
+                     self).join_children_html(children_html)
         if self.group_item_number == 0:
             html = self.HTML_BREAK.join((self.HTML_OUTER_TAGS[0], html))
         if self.group_item_last is True:
@@ -252,16 +528,22 @@ class _BlockElementNotContainingBlock_LineMarksMixin:
     Mixin class for block elements, containing inline elements, that start and
     end with full-line marks.
     """
+    __slots__ = ()
     TEST_END_LINES = 1
 
     def set_end_mark(self, mark):
         self.end_mark = mark
+        if self.langmark.validator is not None:
+            self.langmark.validator.open_fence(self,
+                                        self.langmark.stream.line_number - 1)
 
     def _process_initial_lines(self, lines):
         pass
 
     def check_element_end(self, lines):
         if self.end_mark.fullmatch(lines[0]):
+            if self.langmark.validator is not None:
+                self.langmark.validator.close_fence(self)
             raise _BlockElementEndConsumed()
 
 
@@ -270,6 +552,7 @@ class _BlockElementNotContainingBlock_EmptyLineMixin:
     Mixin class for block elements, containing inline elements, that end with
     an empty line.
     """
+    __slots__ = ()
     TEST_END_LINES = 1
 
     def _process_initial_lines(self, lines):
@@ -284,17 +567,26 @@ class _BlockElementNotContainingBlock(_BlockElement):
     """
     Base class for elements not containing block elements.
     """
+    __slots__ = ('rawtext', )
+    # The elements containing inline elements set their children list only
+    #  after parsing them
+    HAS_CHILDREN = False
     IGNORE_BLANK_LINES = None
     IGNORE_LEADING_SPACE = None
+    STORE_RAWTEXT = True
 
-    def __init__(self, *args, **kwargs):
-        self.rawtext = RawText('')
-        _BlockElement.__init__(self, *args, **kwargs)
+    def __init__(self, langmark_, *args, **kwargs):
+        # Validating needs the source line numbers of the text, see
+        #  _BlockElementContainingInline_Meta._parse_inline
+        self.rawtext = RawText('') if langmark_.validator is None else \
+                                                                SourceText('')
+        _BlockElement.__init__(self, langmark_, *args, **kwargs)
 
     def _add_raw_first_line(self, line):
         # Paragraph overrides this method
         self.rawtext.append(RawText.trim_equivalent_indentation(
-                                            self.indentation_internal, line))
+                                            self.indentation_internal, line),
+                            self.langmark.stream.line_number - 1)
 
     def _read_indented_test_end_lines(self):
         try:
@@ -310,15 +602,10 @@ class _BlockElementNotContainingBlock(_BlockElement):
 
     def _check_and_strip_indentation(self, lines):
         indented_lines = []
+        line_preprocessor = self.parent.line_preprocessor
         for lN, line in enumerate(lines):
-            parent = self.parent
-            while parent:
-                try:
-                    line = parent.preprocess_inline(line,
-                                                    self.indentation_internal)
-                    break
-                except AttributeError:
-                    parent = parent.parent
+            if line_preprocessor:
+                line = line_preprocessor(line, self.indentation_internal)
             if Configuration.BLANK_LINE.fullmatch(line):
                 if not self.IGNORE_BLANK_LINES:
                     self._parse_inline()
@@ -340,7 +627,8 @@ class _BlockElementNotContainingBlock(_BlockElement):
         return indented_lines
 
     def _add_raw_content_lines(self, lines):
-        self.rawtext.append(''.join(lines))
+        self.rawtext.append(''.join(lines),
+                            self.langmark.stream.line_number - len(lines))
 
     def check_element_end(self, lines):
         raise NotImplementedError()
@@ -353,13 +641,29 @@ class _BlockElementContainingInline_Meta(_BlockElementNotContainingBlock):
     """
     Meta class for elements containing inline elements.
     """
+    __slots__ = ('text_factory', )
+    # The text is converted from the inline elements
+    STORE_RAWTEXT = False
+
     def _parse_inline(self):
+        if self.langmark.validator is not None:
+            # Validating only needs the links, which are found without
+            #  parsing the inline elements
+            self.langmark.validator.scan_links(self.langmark, self.rawtext)
+            return
+        # The inline elements take the text factory from their parent
+        self.text_factory = RawTextFactory()
+        limits = self.langmark.limits
+        if limits is not None:
+            self.text_factory = LimitedTextFactory(self.text_factory, limits,
+                                        self.langmark.stream.line_number - 1)
         inline_parser = textparser.TextParser(self.rawtext.text)
         dummyelement = BaseInlineElement(self.langmark, self, inline_parser,
                                          None, None, None)
         dummyelement.take_inline_control()
         inline_parser.parse()
         self.children = dummyelement.children
+        self.text_factory = None
 
 
 class Paragraph(_BlockElementContainingInline_Meta):
@@ -368,6 +672,7 @@ class Paragraph(_BlockElementContainingInline_Meta):
 
     The default container, it ends whenever an empty line is found.
     """
+    __slots__ = ()
     TEST_END_LINES = 1
     IGNORE_BLANK_LINES = False
     IGNORE_LEADING_SPACE = True
@@ -382,7 +687,8 @@ class Paragraph(_BlockElementContainingInline_Meta):
                                             self.indentation_internal, line)
         if indented_line.startswith(' '):
             indented_line = indented_line[1:]
-        self.rawtext.append(indented_line)
+        self.rawtext.append(indented_line,
+                            self.langmark.stream.line_number - 1)
 
     def parse_next_line(self):
         # Don't recurse, otherwise it will raise "RuntimeError: maximum
@@ -424,19 +730,22 @@ class Paragraph(_BlockElementContainingInline_Meta):
     #        line = line[1:]
     #    super(Paragraph, self)._add_raw_line(line)
 
-    def convert_to_html(self):
-        html = self._trim_last_break(''.join(child.convert_to_html()
-                                             for child in self.children))
+    def join_children_html(self, children_html):
+        html = self._trim_last_break(''.join(children_html))
         if len(self.parent.children) > 1:
             return html.join(self.HTML_TAGS)
         else:
             return html
 
+    def join_children_text(self, children_text):
+        return self._trim_last_break(''.join(children_text))
+
 
 class _BlockElementContainingInline(_BlockElementContainingInline_Meta):
     """
     Base class for elements containing inline elements.
     """
+    __slots__ = ()
     IGNORE_BLANK_LINES = True
     IGNORE_LEADING_SPACE = False
 
@@ -456,11 +765,13 @@ class _BlockElementContainingInline(_BlockElementContainingInline_Meta):
                 self._add_raw_content_lines(lines)
                 continue
 
-    def convert_to_html(self):
-        html = self._trim_last_break(''.join(
-                        child.convert_to_html() for child in self.children))
+    def join_children_html(self, children_html):
+        html = self._trim_last_break(''.join(children_html))
         return html.join(self.HTML_TAGS)
 
+    def join_children_text(self, children_text):
+        return self._trim_last_break(''.join(children_text))
+
 
 class _BlockElementContainingInline_LineMarks(
                                 _BlockElementNotContainingBlock_LineMarksMixin,
@@ -469,7 +780,7 @@ class _BlockElementContainingInline_LineMarks(
     A block element, containing inline elements, that starts and ends with
     full-line marks.
     """
-    pass
+    __slots__ = ('end_mark', )
 
 
 class _BlockElementContainingInline_Indented(
@@ -479,13 +790,14 @@ class _BlockElementContainingInline_Indented(
     A block element, containing inline elements, whose start and end are
     only defined by indentation.
     """
-    pass
+    __slots__ = ()
 
 
 class _BlockElementNotContainingInline(_BlockElementNotContainingBlock):
     """
     Base class for elements containing neither inline nor block elements.
     """
+    __slots__ = ()
     IGNORE_BLANK_LINES = True
     IGNORE_LEADING_SPACE = False
 
@@ -510,9 +822,14 @@ class _BlockElementContainingRaw_LineMarks(
     A block element, containing raw text, that starts and ends with full-line
     marks.
     """
+    __slots__ = ('end_mark', )
+
     def convert_to_html(self):
         return self._trim_last_break(self.rawtext.get_raw_text())
 
+    def convert_to_text(self):
+        return self._trim_last_break(self.rawtext.get_raw_text())
+
 
 class _BlockElementContainingRaw_EmptyLine(
                                 _BlockElementNotContainingBlock_EmptyLineMixin,
@@ -521,9 +838,14 @@ class _BlockElementContainingRaw_EmptyLine(
     A block element, containing raw text, that ends with an empty line.
     marks.
     """
+    __slots__ = ()
+
     def convert_to_html(self):
         return self._trim_last_break(self.rawtext.get_raw_text())
 
+    def convert_to_text(self):
+        return self._trim_last_break(self.rawtext.get_raw_text())
+
 
 class _BlockElementContainingText_LineMarks(
                                 _BlockElementNotContainingBlock_LineMarksMixin,
@@ -532,9 +854,14 @@ class _BlockElementContainingText_LineMarks(
     A block element, containing plain text, that starts and ends with full-line
     marks.
     """
+    __slots__ = ('end_mark', )
+
     def convert_to_html(self):
-        return self._trim_last_break(self.rawtext.convert_to_html()).join(
-                                                                self.HTML_TAGS)
+        return self._trim_last_break(self.rawtext.convert_to_html(
+                                self.langmark.escaper)).join(self.HTML_TAGS)
+
+    def convert_to_text(self):
+        return self._trim_last_break(self.rawtext.get_raw_text())
 
 
 class _BlockElementContainingText_Indented(
@@ -544,9 +871,14 @@ class _BlockElementContainingText_Indented(
     A block element, containing plain text, whose start and end are only
     defined by indentation.
     """
+    __slots__ = ()
+
     def convert_to_html(self):
-        return self._trim_last_break(self.rawtext.convert_to_html()).join(
-                                                                self.HTML_TAGS)
+        return self._trim_last_break(self.rawtext.convert_to_html(
+                                self.langmark.escaper)).join(self.HTML_TAGS)
+
+    def convert_to_text(self):
+        return self._trim_last_break(self.rawtext.get_raw_text())
 
 
 class HorizontalRule(_BlockElement):
@@ -560,6 +892,8 @@ class HorizontalRule(_BlockElement):
         * * *
         +  +  +
     """
+    __slots__ = ()
+    HAS_CHILDREN = False
     # TODO: Allow setting the tag style (<hr> or <hr/> or <hr />) more easily
     HTML_TAG = '<hr />'
 
@@ -572,11 +906,15 @@ class HorizontalRule(_BlockElement):
     def convert_to_html(self):
         return self.HTML_TAG
 
+    def convert_to_text(self):
+        return ''
+
 
 class _InlineElement(_Element):
     """
     Base class for inline elements.
     """
+    __slots__ = ('inline_parser', 'inline_bindings', 'text_factory')
     ENABLE_ESCAPE = None
     START_MARK_TO_INLINE_ELEMENT = None
     INLINE_MARK = None
@@ -585,6 +923,7 @@ class _InlineElement(_Element):
     def __init__(self, langmark_, parent, inline_parser, parsed_text,
                  start_mark, is_element_start):
         self.inline_parser = inline_parser
+        self.text_factory = parent.text_factory
         self.inline_bindings = self.install_bindings(parsed_text, start_mark,
                                                             is_element_start)
         if self.ENABLE_ESCAPE:
@@ -600,22 +939,21 @@ class _InlineElement(_Element):
         self.inline_parser.bind_to_parse_end(self._handle_inline_parse_end)
 
     def _handle_inline_escape(self, event):
-        self.children.append(RawText(event.parsed_text +
-                                     event.mark.group()[1]))
+        self.text_factory.add_escaped_text(self.children, event)
 
     def _handle_inline_end_mark(self, event):
         if self.INLINE_MARK.check_end_mark(event.parsed_text, event.mark):
-            self._post_process_inline(event.parsed_text)
+            self.text_factory.add_text(self.children, event)
+            self._post_process_inline()
             self.parent.take_inline_control()
         else:
-            self.children.append(RawText(''.join((event.parsed_text,
-                                                  event.mark.group()))))
+            self.text_factory.add_marked_text(self.children, event)
 
     def _handle_inline_parse_end(self, event):
-        self._post_process_inline(event.remainder_text)
+        self.text_factory.add_remainder_text(self.children, event)
+        self._post_process_inline()
 
-    def _post_process_inline(self, text):
-        self.children.append(RawText(text))
+    def _post_process_inline(self):
         try:
             self.post_process_inline()
         except NotImplementedError:
@@ -629,6 +967,7 @@ class _InlineElementContainingInline(_InlineElement):
     """
     Base class for inline elements containing inline elements.
     """
+    __slots__ = ()
     ENABLE_ESCAPE = True
 
     def install_bindings(self, parsed_text, start_mark, is_element_start):
@@ -642,28 +981,38 @@ class _InlineElementContainingInline(_InlineElement):
         return bindings
 
     def _handle_inline_start_mark(self, event):
-        try:
-            element = self.START_MARK_TO_INLINE_ELEMENT[event.regex](
-                        self.langmark, self, self.inline_parser,
-                        event.parsed_text, event.mark, not bool(self.children))
-        except _InlineElementStartNotMatched:
-            self.children.append(RawText(''.join((event.parsed_text,
-                                                  event.mark.group()))))
-        else:
-            self.children.append(RawText(event.parsed_text))
-            self.children.append(element)
-            element.take_inline_control()
-
-    def convert_to_html(self):
-        html = self._trim_last_break(''.join(child.convert_to_html()
-                                             for child in self.children))
+        Element = self.START_MARK_TO_INLINE_ELEMENT[event.regex]
+        is_element_start = not bool(self.children)
+        # Most false marks are rejected here, without instantiating anything
+        if Element.INLINE_MARK.check_start_mark(event.parsed_text, event.mark,
+                                                is_element_start):
+            try:
+                element = Element(self.langmark, self, self.inline_parser,
+                                  event.parsed_text, event.mark,
+                                  is_element_start)
+            except _InlineElementStartNotMatched:
+                pass
+            else:
+                self.text_factory.add_text(self.children, event)
+                self.children.append(element)
+                element.take_inline_control()
+                return
+        self.text_factory.add_marked_text(self.children, event)
+
+    def join_children_html(self, children_html):
+        html = self._trim_last_break(''.join(children_html))
         return html.join(self.HTML_TAGS)
 
+    def join_children_text(self, children_text):
+        return self._trim_last_break(''.join(children_text))
+
 
 class BaseInlineElement(_InlineElementContainingInline):
     """
     Dummy inline element for parsing other inline elements.
     """
+    __slots__ = ()
+    INDEXED = False
     INLINE_MARK = None
 
 
@@ -671,6 +1020,7 @@ class _InlineElementContainingParameters(_InlineElement):
     """
     Base class for inline elements containing parameters.
     """
+    __slots__ = ('parameters', )
     ENABLE_ESCAPE = True
 
     def __init__(self, *args, **kwargs):
@@ -687,11 +1037,10 @@ class _InlineElementContainingParameters(_InlineElement):
     def _handle_parameter_mark(self, event):
         if self.INLINE_MARK.check_parameter_mark(event.parsed_text,
                                                  event.mark):
-            self.children.append(RawText(event.parsed_text))
+            self.text_factory.add_text(self.children, event)
             self._finalize_parameter()
         else:
-            self.children.append(RawText(''.join((event.parsed_text,
-                                                  event.mark.group()))))
+            self.text_factory.add_marked_text(self.children, event)
 
     def _finalize_parameter(self):
         self.parameters.append(_Parameter(self.langmark, self, self.children))
@@ -714,21 +1063,30 @@ class _Parameter(_Element):
     """
     A parameter element.
     """
+    __slots__ = ()
+    HAS_CHILDREN = False
+
     def __init__(self, langmark_, parent, children):
         _Element.__init__(self, langmark_, parent)
-        self.children[:] = children
+        # The list is handed over by the parent element
+        self.children = children
 
     def get_raw_text(self):
         return ''.join(child.get_raw_text() for child in self.children)
 
-    def convert_to_html(self):
-        return ''.join(child.convert_to_html() for child in self.children)
+    def join_children_html(self, children_html):
+        return ''.join(children_html)
+
+    def join_children_text(self, children_text):
+        return ''.join(children_text)
 
 
 class _InlineElementContainingText(_InlineElement):
     """
     Base class for inline elements containing text.
     """
+    __slots__ = ()
+
     def install_bindings(self, parsed_text, start_mark, is_element_start):
         end_mark = self.INLINE_MARK.make_end_mark(parsed_text, start_mark,
                                                   is_element_start)
@@ -739,22 +1097,32 @@ class _InlineElementContainingRawText(_InlineElementContainingText):
     """
     Base class for inline elements containing raw text.
     """
+    __slots__ = ()
     ENABLE_ESCAPE = False
 
     def convert_to_html(self):
         return ''.join(child.get_raw_text() for child in self.children
                                                         ).join(self.HTML_TAGS)
 
+    def convert_to_text(self):
+        return ''.join(child.get_raw_text() for child in self.children)
+
 
 class _InlineElementContainingHtmlText(_InlineElementContainingText):
     """
     Base class for inline elements containing plain text.
     """
+    __slots__ = ()
     ENABLE_ESCAPE = False
 
     def convert_to_html(self):
-        return ''.join(child.convert_to_html() for child in self.children
-                                                        ).join(self.HTML_TAGS)
+        # The text nodes of inline code are escaped together, with a single
+        #  call for the joined text
+        return self.langmark.escaper.escape(''.join(child.get_raw_text() for
+                            child in self.children)).join(self.HTML_TAGS)
+
+    def convert_to_text(self):
+        return ''.join(child.get_raw_text() for child in self.children)
 
 
 class LineBreak(_Element):
@@ -764,6 +1132,8 @@ class LineBreak(_Element):
         First line`
         second line.
     """
+    __slots__ = ()
+    HAS_CHILDREN = False
     INLINE_MARK = marks._InlineMarkStartOnly(re.compile(r'`\n'))
     # TODO: Allow setting the tag style (<br> or <br/> or <br />) more easily
     HTML_TAG = '<br />'
@@ -778,3 +1148,6 @@ class LineBreak(_Element):
 
     def convert_to_html(self):
         return self.HTML_TAG + self.HTML_BREAK
+
+    def convert_to_text(self):
+        return '\n'
@@ -83,3 +83,32 @@ class _EndOfFile(Exception):
     an element has been stopped by the end of file.
     """
     pass
+
+
+class _ParseInterrupted(Exception):
+    """
+    Internal exception used to stop a parse running in another thread, for
+    example because the coroutine waiting for it has been cancelled.
+    """
+    pass
+
+
+class LimitExceeded(Exception):
+    """
+    Raised when parsing a document exceeds one of the limits set with a
+    base.Limits object.
+    """
+    def __init__(self, limit, value, line_number):
+        self.limit = limit
+        self.value = value
+        self.line_number = line_number
+        Exception.__init__(self, '{} ({}) exceeded at line {}'.format(
+                                                limit, value, line_number))
+
+
+class SerializationError(Exception):
+    """
+    Raised when an elements tree can't be dumped, or a stream can't be loaded
+    as an elements tree, see elements.Root.dump and elements.Root.load.
+    """
+    pass
@@ -17,6 +17,7 @@
 # along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
 
 import re
+import json
 import langmark
 from . import marks
 from .base import Configuration, RawText
@@ -37,10 +38,16 @@ class _BaseFactory:
     def __init__(self):
         pass
 
+    def install(self):
+        # Called by each new Langmark instance, after the extension modules
+        #  have had the chance to modify the class attributes
+        pass
+
     def _find_correct_parent(self, parent, indentation):
-        while indentation < parent.indentation_internal:
-            parent = parent.parent
-        return parent
+        # This is by far the most common case
+        if indentation >= parent.indentation_internal:
+            return parent
+        return parent.langmark.container_stack.find_parent(parent, indentation)
 
 
 class _ElementFactory(_BaseFactory):
@@ -48,6 +55,10 @@ class _ElementFactory(_BaseFactory):
     Base class for content element factories.
     """
     TEST_START_LINES = None
+    # Factories whose marks can never match the same lines as the marks of
+    #  other reorderable factories can be moved by FactoryProfile without
+    #  changing the parsed tree
+    REORDERABLE = False
 
     def make_element(self, langmark_, parent):
         try:
@@ -59,12 +70,15 @@ class _ElementFactory(_BaseFactory):
             pass
         else:
             try:
-                # Finding the element is the actual exception in this algorithm
                 # Note how _do_make_element itself can raise other exceptions
-                raise _BlockElementStartMatched(self._do_make_element(
-                                                    langmark_, parent, lines))
+                element = self._do_make_element(langmark_, parent, lines)
             except _BlockElementStartNotMatched:
                 pass
+            else:
+                if self.REORDERABLE and langmark_.factory_profile:
+                    langmark_.factory_profile.record_hit(langmark_, self)
+                # Finding the element is the actual exception in this algorithm
+                raise _BlockElementStartMatched(element)
         langmark_.stream.rewind_buffer()
         return False
 
@@ -100,22 +114,39 @@ class HeaderElements(_MetaDataElementFactory):
     sequence of spaces after the key string.
     """
     TEST_START_LINES = 1
-    METADATA = re.compile(r'^\:\:[ \t]*(.+?)(?:[ \t]+(.+?))?[ \t]*\n')
+    # Avoid lazy groups followed by optional parts, which would backtrack
+    #  polynomially on long lines that don't match
+    METADATA = re.compile(r'^\:\:[ \t]*([^ \t\n]+)'
+                          r'(?:[ \t]+([^ \t\n](?:[^\n]*[^ \t\n])?))?[ \t]*\n')
+
+    @classmethod
+    def read_keys(cls, stream):
+        # Read only the header lines at the start of stream, without the block
+        #  engine; see Langmark.read_header
+        keys = {}
+        for line in stream:
+            match = cls.METADATA.fullmatch(line)
+            if not match:
+                break
+            keys[match.group(1)] = match.group(2)
+        return keys
 
     def process_match(self, langmark_, match):
         if match:
             langmark_.header.keys[match.group(1)] = match.group(2)
+            if langmark_.validator is not None:
+                langmark_.validator.add_header_key(match.group(1),
+                                            langmark_.stream.line_number - 1)
         else:
-            # This is changing the size of INSTALLED_BLOCK_FACTORIES, so I
+            # This is changing the size of langmark_.block_factories, so I
             #  can't raise _BlockElementStartNotMatched after it, because that
             #  would simply continue the for loop in
             #  _BlockElement.find_element_start, which would hence skip the
             #  next element in the list
-            # Installing this class at the top of INSTALLED_BLOCK_FACTORIES
+            # Installing this class at the top of langmark_.block_factories
             #  makes this as efficient as continuing the loop, since no other
             #  elements are uselessly tested
-            langmark.elements._BlockElementContainingBlock.INSTALLED_BLOCK_FACTORIES.remove(
-                                                                        self)
+            langmark_.block_factories.remove(self)
             langmark_.stream.rewind_buffer()
             # Add an empty line to make it possible to recognize elements that
             # start with an empty line (e.g. headings)
@@ -191,6 +222,29 @@ class _BlockNotIndentedElementFactory(_BlockElementFactory):
         raise NotImplementedError()
 
 
+class _BlockMarksElementFactory(_BlockNotIndentedElementFactory):
+    """
+    Factory for several elements based on marks, all tested with a single
+    match.
+    """
+    # ELEMENTS maps the element classes to their block mark factories, whose
+    #  start marks must capture the indentation in their first group
+    # Additional extension modules can insert their element classes in
+    #  ELEMENTS; they must thus be imported *after* importing langmark, but
+    #  *before* instantiating the Langmark class
+    ELEMENTS = None
+
+    def install(self):
+        self.start_mark = marks.BlockMarkAlternation(self.ELEMENTS)
+
+    def _find_equivalent_indentation(self, langmark_, lines):
+        Element, match = self.start_mark.fullmatch(lines[0])
+        if not match:
+            raise _BlockElementStartNotMatched()
+        indentation = RawText.compute_equivalent_indentation(match.group(1))
+        return (indentation, (match, ), Element)
+
+
 class ParagraphFactory(_BaseFactory):
     """
     Factory for paragraph elements.
@@ -236,3 +290,62 @@ class HorizontalRules(_BlockNotIndentedElementFactory):
                          Element):
         return langmark.elements.HorizontalRule(langmark_, parent, indentation,
                                                 indentation, ())
+
+
+class FactoryProfile:
+    """
+    Hit counts of the reorderable block element factories, used to test the
+    most frequent elements of a corpus first.
+
+    Only the factories with REORDERABLE set are moved, and only among the
+    positions already occupied by reorderable factories, so the constraints on
+    the order of BLOCK_FACTORIES still hold.
+    """
+    # In adaptive mode, reorder the installed factories every time this number
+    #  of new hits has been recorded
+    REORDER_INTERVAL = 256
+
+    def __init__(self, adaptive=True):
+        self.adaptive = adaptive
+        self.hits = {}
+        self.new_hits = 0
+
+    @staticmethod
+    def _make_key(factory):
+        return '.'.join((factory.__class__.__module__,
+                         factory.__class__.__name__))
+
+    def record_hit(self, langmark_, factory):
+        key = self._make_key(factory)
+        self.hits[key] = self.hits.get(key, 0) + 1
+        if self.adaptive:
+            self.new_hits += 1
+            if self.new_hits >= self.REORDER_INTERVAL:
+                self.new_hits = 0
+                self.install(langmark_)
+
+    def sort_factories(self, factories):
+        # sort is stable, so factories with the same number of hits keep their
+        #  current relative order
+        reorderable = sorted((factory for factory in factories
+                              if factory.REORDERABLE),
+                             key=lambda factory: -self.hits.get(
+                                                self._make_key(factory), 0))
+        reordered = iter(reorderable)
+        return [next(reordered) if factory.REORDERABLE else factory
+                for factory in factories]
+
+    def install(self, langmark_):
+        # Note that this is also called in the middle of a parse, but always
+        #  right before a factory raises _BlockElementStartMatched, i.e. when
+        #  the loop in _BlockElementContainingBlock.find_element_start is
+        #  being interrupted anyway
+        langmark_.block_factories = self.sort_factories(
+                                                langmark_.block_factories)
+
+    def load(self, stream):
+        for key, hits in json.load(stream).items():
+            self.hits[key] = self.hits.get(key, 0) + hits
+
+    def save(self, stream):
+        json.dump(self.hits, stream, indent=4, sort_keys=True)
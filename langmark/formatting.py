@@ -25,6 +25,7 @@ class Emphasis(elements._InlineElementContainingInline):
 
         _emphasized_
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableSimple('_')
     HTML_TAGS = ('<em>', '</em>')
 
@@ -35,6 +36,7 @@ class Strong(elements._InlineElementContainingInline):
 
         *strong*
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableSimple('*')
     HTML_TAGS = ('<strong>', '</strong>')
 
@@ -45,6 +47,7 @@ class Superscript(elements._InlineElementContainingInline):
 
         ^^superscript^^
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableSimple2('^')
     HTML_TAGS = ('<sup>', '</sup>')
 
@@ -55,6 +58,7 @@ class Subscript(elements._InlineElementContainingInline):
 
         ,,subscript,,
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableSimple2(',')
     HTML_TAGS = ('<sub>', '</sub>')
 
@@ -65,6 +69,7 @@ class Small(elements._InlineElementContainingInline):
 
         ::small::
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableSimple2(':')
     HTML_TAGS = ('<small>', '</small>')
 
@@ -75,5 +80,6 @@ class Strikethrough(elements._InlineElementContainingInline):
 
         ~~strikethrough~~
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableSimple2('~')
     HTML_TAGS = ('<del>', '</del>')
@@ -17,7 +17,9 @@
 # along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
 
 import re
-from . import elements
+import array
+import bisect
+from . import elements, metadata
 from .base import Configuration
 from .factories import _BlockNotIndentedElementFactory
 from .exceptions import (_BlockElementStartNotMatched,
@@ -29,12 +31,11 @@ from .exceptions import (_BlockElementStartNotMatched,
                          _InlineElementStartNotMatched,
                          _EndOfFile)
 
-# TODO: Implement "sections", i.e. containers of a heading and its subelements
-#       and subheadings. Sections can thus be nested.
-#       Make it possible to disable them.
-#       In HTML sections should be enclosed in <div> tags
-#       Perhaps implement them only when converting to HTML
-#       Also give a way to end a section without starting another, e.g.:
+# Sections, i.e. ranges of the top-level elements made of a heading and the
+#  elements and subheadings that follow it, are indexed by SectionsIndex while
+#  parsing, and enclosed in <div> tags with the section_divs option of
+#  Langmark
+# TODO: Give a way to end a section without starting another, e.g.:
 #
 #       == Parent ==
 #
@@ -50,11 +51,213 @@ from .exceptions import (_BlockElementStartNotMatched,
 #
 
 
+class HeadingsIndex(metadata._MetaDataStorage):
+    """
+    The headings of the document in order, with their level, raw title and
+    anchor, recorded while parsing.
+    """
+    __slots__ = ('entries', 'anchors', 'anchor_counters')
+    ATTRIBUTE_NAME = 'headings'
+    SLUG_SEPARATORS = re.compile(r'[\W_]+')
+    HTML_TOC_ITEM = '<li><a href="#{anchor}">{title}</a>'
+
+    def __init__(self, langmark_):
+        metadata._MetaDataStorage.__init__(self, langmark_)
+        # (level, title, anchor) tuples
+        self.entries = []
+        self.anchors = set()
+        # The last suffix used for each slug, so that colliding titles don't
+        #  test all the previous suffixes again
+        self.anchor_counters = {}
+
+    def make_anchor(self, title):
+        slug = self.SLUG_SEPARATORS.sub('-', title.lower()).strip('-') or \
+                                                                    'section'
+        anchor = slug
+        if anchor in self.anchors:
+            counter = self.anchor_counters.get(slug, 1)
+            while anchor in self.anchors:
+                counter += 1
+                anchor = '{}-{}'.format(slug, counter)
+            self.anchor_counters[slug] = counter
+        self.anchors.add(anchor)
+        return anchor
+
+    def add_heading(self, level, title):
+        anchor = self.make_anchor(title)
+        self.entries.append((level, title, anchor))
+        return anchor
+
+    def convert_to_html(self):
+        """
+        Return the table of contents as nested HTML lists.
+        """
+        html = []
+        # The levels of the open lists
+        levels = []
+        for level, title, anchor in self.entries:
+            if not levels or level > levels[-1]:
+                html.append('<ul>')
+                levels.append(level)
+            else:
+                html.append('</li>')
+                while len(levels) > 1 and level <= levels[-2]:
+                    levels.pop()
+                    html.append('</ul>\n</li>')
+                # Skipped levels leave a list deeper than the heading open
+                levels[-1] = min(levels[-1], level)
+            html.append(self.HTML_TOC_ITEM.format(anchor=anchor,
+                                    title=self.langmark.escaper.escape(title)))
+        if levels:
+            html.append('</li>')
+            html.extend('</ul>\n</li>' for level in levels[1:])
+            html.append('</ul>')
+        return '\n'.join(html)
+
+    def dump_data(self):
+        return self.entries
+
+    def load_data(self, data):
+        for level, title, anchor in data:
+            self.entries.append((level, title, anchor))
+            self.anchors.add(anchor)
+
+
+class Section:
+    """
+    A heading of the document and the top-level elements that follow it, until
+    the next heading of the same or a higher level.
+    """
+    __slots__ = ('level', 'anchor', 'start', 'end', 'parent', 'subsections')
+
+    def __init__(self, level, anchor, start, parent):
+        self.level = level
+        self.anchor = anchor
+        # The indices of the first (the heading) and after the last elements
+        #  in the children of the root element; end is None while the section
+        #  is open, i.e. until the end of the document if the parse was
+        #  interrupted
+        self.start = start
+        self.end = None
+        self.parent = parent
+        self.subsections = []
+
+
+class SectionsIndex(metadata._MetaDataStorage):
+    """
+    The nested sections of the document, built while parsing with a stack of
+    the open sections, and the first source line of every top-level element.
+    """
+    __slots__ = ('sections', 'anchor_to_section', 'stack', 'child_count',
+                 'line_numbers')
+    ATTRIBUTE_NAME = 'sections'
+    HTML_TAGS = ('<div class="langmark-section">', '</div>')
+
+    def __init__(self, langmark_):
+        metadata._MetaDataStorage.__init__(self, langmark_)
+        # The top-level sections
+        self.sections = []
+        self.anchor_to_section = {}
+        self.stack = []
+        # The number of children appended to the root element so far, which
+        #  may not be kept in its children list, see Root.append_child
+        self.child_count = 0
+        # Ascending, indexed like the children of the root element
+        self.line_numbers = array.array('l')
+
+    def add_child(self, element, line_number):
+        self.line_numbers.append(line_number)
+        # Only headings that are children of the root element start sections
+        if isinstance(element, _Heading):
+            while self.stack and self.stack[-1].level >= element.LEVEL:
+                self.stack.pop().end = self.child_count
+            parent = self.stack[-1] if self.stack else None
+            section = Section(element.LEVEL, element.anchor, self.child_count,
+                              parent)
+            (parent.subsections if parent else self.sections).append(section)
+            self.anchor_to_section[section.anchor] = section
+            self.stack.append(section)
+        self.child_count += 1
+
+    def close(self):
+        while self.stack:
+            self.stack.pop().end = self.child_count
+
+    def get_section(self, anchor):
+        return self.anchor_to_section[anchor]
+
+    def find_lines(self, first, last):
+        # Return the range of the indices of the top-level elements that
+        #  overlap the source lines from first to last
+        start = max(bisect.bisect_right(self.line_numbers, first) - 1, 0)
+        end = bisect.bisect_right(self.line_numbers, last)
+        return (start, max(start, end))
+
+    def iterate_sections(self, sections=None):
+        # In document order, without recursing
+        stack = list(reversed(self.sections if sections is None else
+                              sections))
+        while stack:
+            section = stack.pop()
+            yield section
+            stack.extend(reversed(section.subsections))
+
+    def wrap_html(self, children_html, sections=None, offset=0):
+        """
+        Yield the HTML of the children of the root element, enclosing the
+        sections in HTML_TAGS; if only some children starting from the one at
+        offset are passed, sections must be the top-level sections that they
+        contain.
+        """
+        starts = {}
+        ends = {}
+        for section in self.iterate_sections(sections):
+            starts[section.start] = starts.get(section.start, 0) + 1
+            ends[section.end] = ends.get(section.end, 0) + 1
+        for index, html in enumerate(children_html, offset):
+            yield from (self.HTML_TAGS[1] for count in range(ends.pop(index,
+                                                                        0)))
+            yield from (self.HTML_TAGS[0] for count in range(starts.get(index,
+                                                                        0)))
+            yield html
+        # Also the sections left open, whose end is None
+        yield from (self.HTML_TAGS[1] for count in range(sum(ends.values())))
+
+    def dump_data(self):
+        # The sections in document order, with the index of their parent
+        sections = []
+        section_to_index = {}
+        for section in self.iterate_sections():
+            section_to_index[section] = len(sections)
+            sections.append((section.level, section.anchor, section.start,
+                             section.end, section_to_index.get(section.parent,
+                                                               -1)))
+        return {'sections': sections,
+                'line_numbers': self.line_numbers.tolist()}
+
+    def load_data(self, data):
+        self.line_numbers = array.array('l', data['line_numbers'])
+        self.child_count = len(self.line_numbers)
+        sections = []
+        for level, anchor, start, end, parent_index in data['sections']:
+            parent = sections[parent_index] if parent_index != -1 else None
+            section = Section(level, anchor, start, parent)
+            section.end = end
+            (parent.subsections if parent else self.sections).append(section)
+            self.anchor_to_section[anchor] = section
+            sections.append(section)
+
+
 class _Heading(elements._BlockElementContainingInline):
     """
     Base class for heading elements.
     """
+    __slots__ = ('anchor', )
     TEST_END_LINES = 0
+    LEVEL = None
+    COMPACT_ATTRIBUTES = ('anchor', )
+    # Used with the heading_ids option of Langmark
+    HTML_ID_ATTRIBUTE = ' id="{}"'
 
     def _process_initial_lines(self, lines):
         self._add_raw_first_line(lines[0])
@@ -62,6 +265,16 @@ class _Heading(elements._BlockElementContainingInline):
     def check_element_end(self, lines):
         raise _BlockElementEndConsumed()
 
+    def join_children_html(self, children_html):
+        if not self.langmark.heading_ids:
+            return elements._BlockElementContainingInline.join_children_html(
+                                                        self, children_html)
+        html = self._trim_last_break(''.join(children_html))
+        # Insert the attribute before the closing ">" of the start tag
+        start_tag = self.HTML_TAGS[0]
+        return html.join((start_tag[:-1] + self.HTML_ID_ATTRIBUTE.format(
+                        self.anchor) + start_tag[-1:], self.HTML_TAGS[1]))
+
 
 class Heading1(_Heading):
     """
@@ -85,6 +298,8 @@ class Heading1(_Heading):
     start of the line to the line break. The heading must have an empty line
     below itself.
     """
+    __slots__ = ()
+    LEVEL = 1
     HTML_TAGS = ('<h1>', '</h1>')
 
 
@@ -111,6 +326,8 @@ class Heading2(_Heading):
     start of the line to the line break. The heading must have an empty line
     below itself.
     """
+    __slots__ = ()
+    LEVEL = 2
     HTML_TAGS = ('<h2>', '</h2>')
 
 
@@ -124,6 +341,8 @@ class Heading3(_Heading):
     rest of the line is taken literally as the title until the line break. The
     heading must have an empty line below itself.
     """
+    __slots__ = ()
+    LEVEL = 3
     HTML_TAGS = ('<h3>', '</h3>')
 
 
@@ -137,6 +356,8 @@ class Heading4(_Heading):
     rest of the line is taken literally as the title until the line break. The
     heading must have an empty line below itself.
     """
+    __slots__ = ()
+    LEVEL = 4
     HTML_TAGS = ('<h4>', '</h4>')
 
 
@@ -150,6 +371,8 @@ class Heading5(_Heading):
     rest of the line is taken literally as the title until the line break. The
     heading must have an empty line below itself.
     """
+    __slots__ = ()
+    LEVEL = 5
     HTML_TAGS = ('<h5>', '</h5>')
 
 
@@ -163,6 +386,8 @@ class Heading6(_Heading):
     rest of the line is taken literally as the title until the line break. The
     heading must have an empty line below itself.
     """
+    __slots__ = ()
+    LEVEL = 6
     HTML_TAGS = ('<h6>', '</h6>')
 
 
@@ -170,19 +395,30 @@ class HeadingElements(_BlockNotIndentedElementFactory):
     """
     Factory for heading elements.
     """
-    TEST_START_LINES = 3
+    # Only the first line is read in advance: the second and third lines are
+    #  read only if the first one can start a multi-line heading
+    TEST_START_LINES = 1
     ELEMENTS = (Heading1, Heading2, Heading3, Heading4, Heading5, Heading6)
+    # Any heading starts with an equal or dash sign or with an empty line
+    FIRST_LINE_MARK = re.compile(r'[\=\-]|[ \t]*\n')
     # ONELINE_MARK's second capturing group will be used as the element
-    #  content.
-    ONELINE_MARK = re.compile(r'^(\=+)[ \t]*((?:(?<=[ \t])\=|[^\=]).*?)'
-                              r'[ \t]*\=*[ \t]*\n')
+    #  content, after stripping the optional closing mark: matching it with a
+    #  lazy group would backtrack quadratically on long runs of "="; the
+    #  lookahead fails early on lines without a line break
+    ONELINE_MARK = re.compile(r'^(?=[^\n]*\n)(\=+)[ \t]*'
+                              r'((?:(?<=[ \t])\=|[^\=])[^\n]*)\n')
     START_MARK_1 = re.compile(r'^\={3,}[ \t]*\n')
     START_MARK_2 = re.compile(r'^[\=\-]{3,}[ \t]*\n')
-    TITLE_MARK = re.compile(r'^[ \t]*(.+?)[ \t]*\n')
+    # Like ONELINE_MARK, TITLE_MARK must not use a lazy group followed by
+    #  optional whitespace characters
+    TITLE_MARK = re.compile(r'^(?=[^\n]*\n)[ \t]*'
+                            r'([^ \t\n](?:[^\n]*[^ \t\n])?)[ \t]*\n')
     END_MARK_1 = re.compile(r'^\={3,}[ \t]*\n')
     END_MARK_2 = re.compile(r'^[\=\-]{3,}[ \t]*\n')
 
     def _find_equivalent_indentation(self, langmark_, lines):
+        if not self.FIRST_LINE_MARK.match(lines[0]):
+            raise _BlockElementStartNotMatched()
         return (0, (), None)
 
     def _do_find_element(self, langmark_, parent, lines, indentation, matches,
@@ -192,37 +428,41 @@ class HeadingElements(_BlockNotIndentedElementFactory):
             level = min(len(match.group(1)), 6)
             Element = self.ELEMENTS[level - 1]
             title = match.group(2)
-            langmark_.stream.rewind_lines(lines[1], lines[2])
-
-        elif Configuration.BLANK_LINE.fullmatch(lines[0]):
-            match2 = self.TITLE_MARK.fullmatch(lines[1])
-            if not match2:
-                raise _BlockElementStartNotMatched()
-            if self.END_MARK_1.fullmatch(lines[2]):
-                Element = Heading1
-            elif self.END_MARK_2.fullmatch(lines[2]):
-                Element = Heading2
-            else:
-                raise _BlockElementStartNotMatched()
-            title = match2.group(1)
+            # The first character is always part of the title
+            title = title[0] + title[1:].rstrip(' \t').rstrip('=').rstrip(
+                                                                        ' \t')
 
         else:
-            if self.START_MARK_1.fullmatch(lines[0]):
-                if self.END_MARK_1.fullmatch(lines[2]):
-                    Element = Heading1
-                elif self.END_MARK_2.fullmatch(lines[2]):
-                    Element = Heading2
-                else:
-                    raise _BlockElementStartNotMatched()
+            if Configuration.BLANK_LINE.fullmatch(lines[0]) or \
+                                        self.START_MARK_1.fullmatch(lines[0]):
+                end_marks = ((self.END_MARK_1, Heading1),
+                             (self.END_MARK_2, Heading2))
             elif self.START_MARK_2.fullmatch(lines[0]):
-                if not self.END_MARK_2.fullmatch(lines[2]):
-                    raise _BlockElementStartNotMatched()
-                Element = Heading2
+                end_marks = ((self.END_MARK_2, Heading2), )
             else:
                 raise _BlockElementStartNotMatched()
-            match2 = self.TITLE_MARK.fullmatch(lines[1])
+            match2 = self.TITLE_MARK.fullmatch(self._read_next_line(parent))
             if not match2:
                 raise _BlockElementStartNotMatched()
+            line = self._read_next_line(parent)
+            for end_mark, Element in end_marks:
+                if end_mark.fullmatch(line):
+                    break
+            else:
+                raise _BlockElementStartNotMatched()
             title = match2.group(1)
 
-        return Element(langmark_, parent, 0, 0, (title, ))
+        element = Element(langmark_, parent, 0, 0, (title, ))
+        # Index the heading here, when it's created, so that no traversal of
+        #  the tree is needed later
+        element.anchor = langmark_.headings.add_heading(Element.LEVEL, title)
+        return element
+
+    @staticmethod
+    def _read_next_line(parent):
+        # The line is added to the stream buffer, so it's rewound together
+        #  with the first line if the heading is not matched
+        try:
+            return parent.read_more_lines(1)[-1]
+        except _EndOfFile:
+            raise _BlockElementStartNotMatched()
@@ -35,15 +35,22 @@ class HTMLElements(_BlockNotIndentedElementFactory):
     Factory for HTML block elements.
     """
     TEST_START_LINES = 2
+    REORDERABLE = True
     # Trying to recognize an element as a container (i.e. associating a start
     #  and end tag and a content in between) is too complex for the purpose of
     #  this application, also because some tags need a closing tag, others are
     #  self-closed, some can stay inside a paragraph, others can't etc.
     #  It must be up to the editor to use the tags correctly
     # TODO: Instantiate only for actual HTML block elements (no inline/span)
-    HTML_RE = r'<(?:\!--.*?|(!doctype|/?[a-z][a-z0-9]*)(?:\s[^>]*|/)?>)'
-    BLOCK_MARK = re.compile(HTML_RE.join((r'^([ \t]*)', r'[ \t]*\n')),
-                            re.IGNORECASE)
+    # A line starting with "<!--" is a comment block, even if the comment
+    #  isn't closed in it; attributes can't contain "<", so that searching
+    #  the marks in a long text without ">" stays linear
+    HTML_RE = r'<(?:\!--|(!doctype|/?[a-z][a-z0-9]*)(?:\s[^<>]*|/)?>)'
+    # Inline comments are instead HTMLInlineComment elements
+    HTML_TAG_RE = r'<(!doctype|/?[a-z][a-z0-9]*)(?:\s[^<>]*|/)?>'
+    # The lookahead fails early on lines without a line break
+    BLOCK_MARK = re.compile(r'^(?=[^\n]*\n)([ \t]*)(?:<\!--[^\n]*|{}[ \t]*)\n'
+                            .format(HTML_RE), re.IGNORECASE)
 
     def _find_equivalent_indentation(self, langmark_, lines):
         match1 = Configuration.BLANK_LINE.fullmatch(lines[0])
@@ -69,7 +76,11 @@ class HTMLBlockTag(elements._BlockElementContainingRaw_EmptyLine):
         </tag>
         <tag attribute="value" />
     """
-    pass
+    __slots__ = ()
+
+    def convert_to_text(self):
+        # HTML tags aren't visible text
+        return ''
 
 
 class HTMLInlineTag(elements._Element):
@@ -80,18 +91,20 @@ class HTMLInlineTag(elements._Element):
         </tag>
         <tag attribute="value" />
     """
+    __slots__ = ()
     # Trying to recognize the element as a container (i.e. associating a start
     #  and end tag and a content in between) is too complex for the purpose of
     #  this application, also because some tags need a closing tag, others are
     #  self-closed, some can stay inside a paragraph, others can't etc.
     #  It must be up to the editor to use the tags correctly
-    INLINE_MARK = marks._InlineMarkStartOnly(re.compile(HTMLElements.HTML_RE,
-                                                        re.IGNORECASE))
+    INLINE_MARK = marks._InlineMarkStartOnly(re.compile(
+                                HTMLElements.HTML_TAG_RE, re.IGNORECASE))
 
     def __init__(self, langmark_, parent, inline_parser, parsed_text,
                  start_mark, is_element_start):
         elements._Element.__init__(self, langmark_, parent)
-        self.children.append(RawText(start_mark.group()))
+        self.children.append(parent.text_factory.make_mark_text(parsed_text,
+                                                                start_mark))
         self.parent.take_inline_control()
 
     def take_inline_control(self):
@@ -99,3 +112,29 @@ class HTMLInlineTag(elements._Element):
 
     def convert_to_html(self):
         return self.children[0].get_raw_text()
+
+    def convert_to_text(self):
+        return ''
+
+
+class HTMLInlineComment(elements._InlineElementContainingRawText):
+    """
+    Inline HTML comment::
+
+        <!-- comment -->
+
+    The comment is copied unchanged, without parsing or escaping its content;
+    a comment that isn't closed in its block is closed at the end of it.
+    """
+    __slots__ = ()
+    INLINE_MARK = marks._InlineMarkStartEndLiteral('<!--', '-->')
+    HTML_TAGS = ('<!--', '-->')
+
+    def convert_to_html(self):
+        # An unclosed comment takes the line break at the end of its block
+        return self._trim_last_break(''.join(child.get_raw_text() for child in
+                                        self.children)).join(self.HTML_TAGS)
+
+    def convert_to_text(self):
+        # Comments aren't visible text
+        return ''
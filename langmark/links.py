@@ -17,8 +17,10 @@
 # along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
 
 import re
+import sys
+import json
+import types
 from . import (marks, metadata, elements)
-from .base import RawText
 from .factories import _MetaDataElementFactory
 from .exceptions import (_BlockElementStartNotMatched,
                          _BlockElementStartConsumed,
@@ -30,32 +32,115 @@ from .exceptions import (_BlockElementStartNotMatched,
                          _EndOfFile)
 
 
+class SharedLinks:
+    """
+    A frozen table of link definitions, e.g. those shared by all the documents
+    of a site, which the definitions of each document override.
+    """
+    __slots__ = ('id_to_data', )
+
+    def __init__(self, id_to_data):
+        # id_to_data maps the ids to (url, title) tuples, like
+        #  LinksData.id_to_data of a parsed document of definitions; they're
+        #  escaped by each document with its own escaper, see LinksData
+        self.id_to_data = types.MappingProxyType({
+                                    id_: (url, title or None)
+                                    for id_, (url, title) in
+                                    id_to_data.items()})
+
+    @classmethod
+    def load(cls, stream):
+        data = json.load(stream)
+        if not isinstance(data, dict) or not all(isinstance(value, list) and
+                                len(value) == 2 and isinstance(value[0], str)
+                                and isinstance(value[1], (str, type(None)))
+                                for value in data.values()):
+            raise ValueError('not a JSON object mapping the link ids to '
+                             '[url, title] arrays')
+        return cls(data)
+
+    def save(self, stream):
+        json.dump(dict(self.id_to_data), stream, indent=4, sort_keys=True)
+
+
 class LinksData(metadata._MetaDataStorage):
     """
     Data on the links in the text.
     """
+    __slots__ = ('id_to_data', 'id_to_html', 'id_to_line', 'duplicate_ids',
+                 'shared', 'shared_html')
     ATTRIBUTE_NAME = 'links'
 
     def __init__(self, langmark_):
         metadata._MetaDataStorage.__init__(self, langmark_)
+        # The raw (url, title) of each id, and the same strings already
+        #  escaped for HTML, so that links only need a lookup when converted
         self.id_to_data = {}
+        self.id_to_html = {}
+        # The source line number of the first definition of each id, when
+        #  known, and the line numbers of the other definitions of the ids
+        #  defined more than once, which Langmark.validate reports
+        self.id_to_line = {}
+        self.duplicate_ids = {}
+        # The SharedLinks looked up for the ids not defined in the document;
+        #  their data is never copied here, only the HTML of the ids used by
+        #  the document, escaped on the first use
+        self.shared = langmark_.shared_links
+        self.shared_html = {}
 
-    def add_id(self, id_, url, title):
-        self.id_to_data[id_] = (RawText(url),
-                                RawText(title) if title else None)
+    def add_id(self, id_, url, title, line_number=None):
+        data = (url, title or None)
+        try:
+            previous = self.id_to_data[id_]
+        except KeyError:
+            self.id_to_line[id_] = line_number
+        else:
+            self.duplicate_ids.setdefault(id_, []).append(line_number)
+            if previous == data:
+                # Links that repeat the same definition are common, don't
+                #  escape it again
+                return
+        self.id_to_data[id_] = data
+        self.id_to_html[id_] = self._make_data_html(url, title)
+
+    def _make_data_html(self, url, title):
+        # Many ids share the same URL, so intern the escaped strings
+        escape = self.langmark.escaper.escape_attribute
+        return (sys.intern(escape(url)),
+                sys.intern(escape(title)) if title else None)
+
+    def dump_data(self):
+        return self.id_to_data
+
+    def load_data(self, data):
+        for id_, (url, title) in data.items():
+            self.add_id(id_, url, title)
 
     def get_data_html(self, id_):
         try:
-            data = self.id_to_data[id_]
-            url = data[0].convert_to_html()
+            return self.id_to_html[id_]
+        except KeyError:
+            pass
+        try:
+            return self.shared_html[id_]
+        except KeyError:
             try:
-                title = data[1].convert_to_html()
-            except AttributeError:
-                title = None
-            return (url, title)
+                url, title = self.shared.id_to_data[id_]
+            except (KeyError, AttributeError):
+                # The passed value may not be a defined id
+                raise ValueError
+            html = self.shared_html[id_] = self._make_data_html(url, title)
+            return html
+
+    def get_url(self, id_):
+        try:
+            return self.id_to_data[id_][0]
         except KeyError:
-            # The passed value may not be a defined id
-            raise ValueError
+            try:
+                return self.shared.id_to_data[id_][0]
+            except (KeyError, AttributeError):
+                # The passed value may not be a defined id
+                raise ValueError
 
 
 class Link(elements._InlineElementContainingParameters):
@@ -69,9 +154,13 @@ class Link(elements._InlineElementContainingParameters):
         [text|id|url]
         [text|id|url|title]
     """
+    __slots__ = ()
     INLINE_MARK = marks._InlineMarkEscapableStartEnd('[', ']')
     HTML_TAGS = ('<a href="{href}">', '<a href="{href}" title="{title}">',
                  '</a>')
+    # With the text_link_urls option of Langmark; the URL is never repeated
+    #  when it's also the text of the link
+    TEXT_FORMAT = '{text} <{url}>'
 
     def post_process_parameters(self):
         try:
@@ -84,9 +173,9 @@ class Link(elements._InlineElementContainingParameters):
             title = None
         self.langmark.links.add_id(self.children[1].get_raw_text(), url, title)
 
-    def convert_to_html(self):
+    def join_children_html(self, children_html):
         par1 = self.children[0]
-        text = par1.convert_to_html()
+        text = children_html[0]
         try:
             par2 = self.children[1]
         except IndexError:
@@ -103,7 +192,7 @@ class Link(elements._InlineElementContainingParameters):
                 href, title = \
                     self.langmark.links.get_data_html(id_)
             except ValueError:
-                href = par2.convert_to_html()
+                href = children_html[1]
                 title = None
         if title:
             return text.join((self.HTML_TAGS[1].format(href=href,
@@ -111,6 +200,28 @@ class Link(elements._InlineElementContainingParameters):
         return text.join((self.HTML_TAGS[0].format(href=href),
                           self.HTML_TAGS[2]))
 
+    def join_children_text(self, children_text):
+        text = children_text[0]
+        if not self.langmark.text_link_urls:
+            return text
+        # Find the URL like join_children_html
+        try:
+            par2 = self.children[1]
+        except IndexError:
+            try:
+                url = self.langmark.links.get_url(
+                                            self.children[0].get_raw_text())
+            except ValueError:
+                url = text
+        else:
+            try:
+                url = self.langmark.links.get_url(par2.get_raw_text())
+            except ValueError:
+                url = children_text[1]
+        if url == text:
+            return text
+        return self.TEXT_FORMAT.format(text=text, url=url)
+
 
 class LinkDefinitions(_MetaDataElementFactory):
     """
@@ -120,12 +231,16 @@ class LinkDefinitions(_MetaDataElementFactory):
         [id]: url "Title"
     """
     TEST_START_LINES = 1
-    METADATA = re.compile(r'^[ \t]*\[(.+?)\]:[ \t]+(.+?)'
-                          r'(?:[ \t]+(?:\'(.+?)\'|"(.+?)"|\((.+?)\)|(.+?)))?'
+    # The id ends at the first "]:" followed by a space, the url at the first
+    #  space; see also HeaderElements.METADATA
+    METADATA = re.compile(r'^[ \t]*\[((?:[^\]\n]|\](?!:[ \t]))+)\]:[ \t]+'
+                          r'([^ \t\n]+)(?:[ \t]+(?:\'([^\n]+)\'|"([^\n]+)"|'
+                          r'\(([^\n]+)\)|([^ \t\n](?:[^\n]*[^ \t\n])?)))?'
                           r'[ \t]*\n')
 
     def process_match(self, langmark_, match):
         if not match:
             raise _BlockElementStartNotMatched()
         langmark_.links.add_id(match.group(1), match.group(2), match.group(3)
-                        or match.group(4) or match.group(5) or match.group(6))
+                        or match.group(4) or match.group(5) or match.group(6),
+                        langmark_.stream.line_number - 1)
@@ -19,9 +19,8 @@
 import re
 from . import (marks, elements)
 from .base import RawText
-from .factories import _BlockNotIndentedElementFactory
-from .exceptions import (_BlockElementStartNotMatched,
-                         _BlockElementStartConsumed,
+from .factories import _BlockMarksElementFactory
+from .exceptions import (_BlockElementStartConsumed,
                          _BlockElementStartMatched,
                          _BlockElementContinue,
                          _BlockElementEndConsumed,
@@ -36,6 +35,7 @@ class UnorderedListItem(elements._BlockElementContainingBlock_PrefixGrouped):
 
         * List item
     """
+    __slots__ = ()
     # TODO: For the moment it's impossible to have two separate lists without
     #       other elements between them
     HTML_OUTER_TAGS = ('<ul>', '</ul>')
@@ -49,6 +49,7 @@ class NumberedListItem(elements._BlockElementContainingBlock_PrefixGrouped):
         #. List item
         1. List item
     """
+    __slots__ = ()
     # TODO: For the moment it's impossible to have two separate lists without
     #       other elements between them
     HTML_OUTER_TAGS = ('<ol>', '</ol>')
@@ -62,6 +63,7 @@ class LatinListItem(elements._BlockElementContainingBlock_PrefixGrouped):
         &. List item
         a. List item
     """
+    __slots__ = ()
     # TODO: For the moment it's impossible to have two separate lists without
     #       other elements between them
     # TODO: Let customize the class name
@@ -69,28 +71,18 @@ class LatinListItem(elements._BlockElementContainingBlock_PrefixGrouped):
     HTML_TAGS = ('<li>', '</li>')
 
 
-class ListElements(_BlockNotIndentedElementFactory):
+class ListElements(_BlockMarksElementFactory):
     """
     Factory for list elements.
     """
     TEST_START_LINES = 1
+    REORDERABLE = True
     ELEMENTS = {
         UnorderedListItem: marks.BlockMarkPrefix(r'\*'),
         NumberedListItem: marks.BlockMarkPrefix(r'(?:[0-9]+|#)\.'),
         LatinListItem: marks.BlockMarkPrefix(r'[a-zA-Z&]\.'),
     }
 
-    def _find_equivalent_indentation(self, langmark_, lines):
-        for Element in self.ELEMENTS:
-            mark = self.ELEMENTS[Element]
-            match = mark.prefix.fullmatch(lines[0])
-            if match:
-                break
-        else:
-            raise _BlockElementStartNotMatched()
-        indentation = RawText.compute_equivalent_indentation(match.group(1))
-        return (indentation, (match, ), Element)
-
     def _do_find_element(self, langmark_, parent, lines, indentation, matches,
                          Element):
         external_indentation = indentation
@@ -32,7 +32,8 @@ class _BlockMarkFactory:
     """
     Base class for block mark factories.
     """
-    pass
+    def get_start_mark(self):
+        raise NotImplementedError()
 
 
 class BlockMarkSimple(_BlockMarkFactory):
@@ -48,6 +49,9 @@ class BlockMarkSimple(_BlockMarkFactory):
         escaped_char = re.escape(char[0])
         self.start = re.compile(self.START.format(escaped_char=escaped_char))
 
+    def get_start_mark(self):
+        return self.start
+
     def make_end_mark(self, start_match):
         return re.compile(re.escape(start_match.group(2)) + self.END)
 
@@ -58,11 +62,16 @@ class BlockMarkPrefix(_BlockMarkFactory):
     """
     # Without the space after 'prefix' there would be a clash with some
     #  inline elements at the start of a line
-    PREFIX = r'^([ \t]*)({prefix}[ \t]+)(.*\n)'
+    # The lookahead fails early on lines without a line break, which would
+    #  otherwise be scanned again for each split of the whitespace characters
+    PREFIX = r'^(?=[^\n]*\n)([ \t]*)({prefix}[ \t]+)(.*\n)'
 
     def __init__(self, regex):
         self.prefix = re.compile(self.PREFIX.format(prefix=regex))
 
+    def get_start_mark(self):
+        return self.prefix
+
 
 class BlockMarkPrefixCompact(_BlockMarkFactory):
     """
@@ -71,31 +80,98 @@ class BlockMarkPrefixCompact(_BlockMarkFactory):
     """
     # Contrary to BlockMarkPrefix, there's no space after 'prefix', so there
     #  must not be ambiguity with inline elements at the start of a line
-    PREFIX = r'^([ \t]*)({escaped_char}[ \t]*)(.*\n)'
+    PREFIX = r'^(?=[^\n]*\n)([ \t]*)({escaped_char}[ \t]*)(.*\n)'
 
     def __init__(self, char):
         # Make sure that char is a single character
         escaped_char = re.escape(char[0])
         self.prefix = re.compile(self.PREFIX.format(escaped_char=escaped_char))
 
+    def get_start_mark(self):
+        return self.prefix
+
 
 class BlockMarkRepeat(_BlockMarkFactory):
     """
     A simple sequence of the same character, optionally alternated with spaces.
     """
-    RE = r'^([ \t]*)([{escaped_chars}] ?){{3,}}\2*[{escaped_chars}]?[ \t]*\n'
+    # Each repetition must consume a character, so that a line that doesn't
+    #  match is rejected in linear time
+    RE = (r'^(?=[^\n]*\n)([ \t]*)[{escaped_chars}]'
+          r'(?: ?[{escaped_chars}]){{2,}} ?[ \t]*\n')
 
     def __init__(self, *chars):
         # Make sure that each char is a single character
         escaped_chars = '|'.join(re.escape(char[0]) for char in chars)
         self.mark = re.compile(self.RE.format(escaped_chars=escaped_chars))
 
+    def get_start_mark(self):
+        return self.mark
+
+
+class BlockMarkAlternation(_BlockMarkFactory):
+    """
+    The alternation of the start marks of several elements, telling with a
+    single match which element, if any, starts in a line.
+    """
+    # Each alternative is enclosed in a named group that closes after all the
+    #  groups of the original mark, so Match.lastgroup identifies the element
+    # The original marks must not use named groups, backreferences or
+    #  conditional groups, whose group numbers would change in the alternation
+    ALTERNATIVE = r'(?P<{name}>{regex})'
+    GROUP_REFERENCE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?P[<=]|'
+                                 r'\(\?\(')
+    SCOPED_FLAGS = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'),
+                    (re.DOTALL, 's'), (re.VERBOSE, 'x'))
+
+    def __init__(self, element_to_mark):
+        # element_to_mark is an ordered mapping of element classes to their
+        #  block mark factories; the marks are tested in the same order
+        self.element_to_mark = element_to_mark
+        self.name_to_element = {}
+        alternatives = []
+        for index, Element in enumerate(element_to_mark):
+            name = 'element{}'.format(index)
+            self.name_to_element[name] = Element
+            regex = element_to_mark[Element].get_start_mark()
+            if self.GROUP_REFERENCE.search(regex.pattern):
+                raise ValueError('the start mark of {} uses group names or '
+                                 'references'.format(Element.__name__))
+            pattern = self._make_scoped_pattern(regex)
+            alternatives.append(self.ALTERNATIVE.format(name=name,
+                                                        regex=pattern))
+        self.mark = re.compile('|'.join(alternatives))
+
+    def _make_scoped_pattern(self, regex):
+        # Preserve the flags the mark was compiled with
+        flags = ''.join(letter for flag, letter in self.SCOPED_FLAGS
+                        if regex.flags & flag)
+        if flags:
+            return '(?{}:{})'.format(flags, regex.pattern)
+        return regex.pattern
+
+    def get_start_mark(self):
+        return self.mark
+
+    def fullmatch(self, line):
+        match = self.mark.fullmatch(line)
+        if not match:
+            return (None, None)
+        Element = self.name_to_element[match.lastgroup]
+        # Matching the element's own mark again, only when the line is a hit,
+        #  gives the caller the capturing groups with their original numbers
+        return (Element,
+                self.element_to_mark[Element].get_start_mark().fullmatch(line))
+
 
 class _InlineMarkFactory:
     """
     Base class for inline mark factories.
     """
-    pass
+    def check_start_mark(self, parsed_text, start_mark, is_element_start):
+        # Tell cheaply, before instantiating the element, whether start_mark
+        #  may start it
+        return True
 
 
 class _InlineMarkStartOnly(_InlineMarkFactory):
@@ -106,11 +182,26 @@ class _InlineMarkStartOnly(_InlineMarkFactory):
         self.start = regex
 
 
+class _InlineMarkStartEndLiteral(_InlineMarkFactory):
+    """
+    Mark for inline elements that start and end with fixed strings, and whose
+    content is never parsed.
+    """
+    def __init__(self, start, end):
+        self.start = re.compile(re.escape(start))
+        self.end = re.compile(re.escape(end))
+
+    def make_end_mark(self, parsed_text, start_mark, is_element_start):
+        return self.end
+
+    def check_end_mark(self, parsed_text, end_mark):
+        return True
+
+
 class _InlineMarkStartParametersEnd(_InlineMarkFactory):
     """
     Base class for marks for inline elements with content or parameters.
     """
-    PRE_START_TEST = r'(?:(\n)|([ \t]?)|({escaped_char}))\Z'
     PRE_END_TEST_NORMAL = r'[{escaped_char} \t]'
     PRE_END_TEST_SPACED = re.compile(r'\n[ \t]*\Z', re.MULTILINE)
     POSSIBLE_MARK = r'({escaped_char}{quantifier})(?!{escaped_char}|$)([ \t])?'
@@ -123,6 +214,7 @@ class _InlineMarkStartParametersEnd(_InlineMarkFactory):
 
     def __init__(self, start_char, end_char, min_chars, max_chars):
         # Make sure that *_char are single characters
+        self.start_char = start_char[0]
         self.escaped_start_char = re.escape(start_char[0])
         self.escaped_end_char = re.escape(end_char[0])
         # I also considered treating 1-character marks differently, making them
@@ -144,8 +236,6 @@ class _InlineMarkStartParametersEnd(_InlineMarkFactory):
         self.start = re.compile(self.POSSIBLE_MARK.format(
                 escaped_char=self.escaped_start_char, quantifier=quantifier),
                 re.MULTILINE)
-        self.pre_start_test = re.compile(self.PRE_START_TEST.format(
-                        escaped_char=self.escaped_start_char), re.MULTILINE)
         self.pre_end_test_normal = re.compile(self.PRE_END_TEST_NORMAL.format(
                             escaped_char=self.escaped_end_char), re.MULTILINE)
         self.pre_end_test_spaced = self.PRE_END_TEST_SPACED
@@ -160,15 +250,18 @@ class _InlineMarkStartParametersEnd(_InlineMarkFactory):
         return self._make_marks(parsed_text, start_mark, is_element_start,
                         self._make_end_mark_normal, self._make_end_mark_spaced)
 
-    def _make_marks(self, parsed_text, start_mark, is_element_start,
-                    _make_marks_normal, _make_marks_spaced):
-        # Yes, most of this could be done directly in the regular expression,
-        #  but good luck with that... Also remember that Python's standard re
-        #  module doesn't support variable-length look-behind...
-        line_start, pre_space, pre_char = self.pre_start_test.search(
-                                                        parsed_text).groups()
-        if pre_char is not None:
-            raise _InlineElementStartNotMatched()
+    def check_start_mark(self, parsed_text, start_mark, is_element_start):
+        return self._test_start_mark(parsed_text, start_mark,
+                                     is_element_start) is not None
+
+    def _test_start_mark(self, parsed_text, start_mark, is_element_start):
+        # Return None if start_mark cannot start an element, otherwise whether
+        #  the element uses the spaced variant of the marks
+        # Only the last parsed character and the mark groups are needed, so
+        #  this is cheap enough to be tested before instantiating the element
+        pre_char = parsed_text[-1:]
+        if pre_char == self.start_char:
+            return None
 
         # There's no need to look for escaped characters: that's already done
         #  by the normal escaping algorithm, and every time a character is
@@ -182,21 +275,35 @@ class _InlineMarkStartParametersEnd(_InlineMarkFactory):
         #  by the parser engine
         # Note that end marks at the end of lines are already excluded by the
         #  regular expression
-        if is_element_start or line_start is not None:
-            if post_space:
-                # \n** text...
-                return _make_marks_spaced(possible_mark)
+        if is_element_start or pre_char == '\n':
+            # \n** text...
             # \n**text...
-            return _make_marks_normal(possible_mark)
+            spaced = bool(post_space)
         elif post_space:
-            if pre_space:
-                # ... ** text...
-                return _make_marks_spaced(possible_mark)
-            # ...** text...
+            if pre_char not in (' ', '\t'):
+                # ...** text...
+                return None
+            # ... ** text...
+            spaced = True
+        else:
+            # ...**text...
+            # ... **text...
+            spaced = False
+
+        # Spaced marks must be at least 2 characters long
+        if spaced and len(possible_mark) < 2:
+            return None
+        return spaced
+
+    def _make_marks(self, parsed_text, start_mark, is_element_start,
+                    _make_marks_normal, _make_marks_spaced):
+        spaced = self._test_start_mark(parsed_text, start_mark,
+                                       is_element_start)
+        if spaced is None:
             raise _InlineElementStartNotMatched()
-        # ...**text...
-        # ... **text...
-        return _make_marks_normal(possible_mark)
+        if spaced:
+            return _make_marks_spaced(start_mark.group(1))
+        return _make_marks_normal(start_mark.group(1))
 
     def _make_parameter_and_end_marks_normal(self, mark):
         parameter_mark = re.compile(self.PARAMETER_MARK_NORMAL.format(
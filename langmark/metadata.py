@@ -21,18 +21,34 @@ class _MetaDataStorage:
     """
     Base class for metadata-storing objects.
     """
+    __slots__ = ('langmark', )
     ATTRIBUTE_NAME = None
 
     def __init__(self, langmark):
         self.langmark = langmark
 
+    def dump_data(self):
+        # Return the data to be serialized with the elements tree, as an
+        #  object that can be encoded in JSON
+        raise NotImplementedError()
+
+    def load_data(self, data):
+        raise NotImplementedError()
+
 
 class Header(_MetaDataStorage):
     """
     The header of the document, hosting the meta data.
     """
+    __slots__ = ('keys', )
     ATTRIBUTE_NAME = 'header'
 
     def __init__(self, langmark):
         _MetaDataStorage.__init__(self, langmark)
         self.keys = {}
+
+    def dump_data(self):
+        return self.keys
+
+    def load_data(self, data):
+        self.keys = data
@@ -0,0 +1,77 @@
+# Langmark - A powerful and extensible lightweight markup language.
+# Copyright (C) 2015 Dario Giovannetti <dev@dariogiovannetti.net>
+#
+# This file is part of Langmark.
+#
+# Langmark is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Langmark is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class Transform:
+    """
+    Base class for the post-processing plugins run by Pipeline.
+    """
+    __slots__ = ()
+    # Map the visited node classes, including text classes like base.RawText,
+    #  to the names of the methods that receive their instances, also those
+    #  of their subclasses
+    VISITORS = {}
+
+    def start(self, langmark_):
+        pass
+
+    def finish(self, langmark_):
+        pass
+
+
+class Pipeline:
+    """
+    Run the visitors of several transforms in a single traversal of the tree.
+    """
+    __slots__ = ('transforms', 'class_to_callbacks')
+
+    def __init__(self, transforms):
+        self.transforms = list(transforms)
+        # The callbacks of each visited class, resolved only once
+        self.class_to_callbacks = {}
+
+    def _get_callbacks(self, Class):
+        try:
+            return self.class_to_callbacks[Class]
+        except KeyError:
+            # The callbacks are called in the order of the transforms
+            callbacks = self.class_to_callbacks[Class] = tuple(
+                                getattr(transform, method_name)
+                                for transform in self.transforms
+                                for VisitedClass, method_name in
+                                transform.VISITORS.items()
+                                if issubclass(Class, VisitedClass))
+            return callbacks
+
+    def start(self, langmark_):
+        for transform in self.transforms:
+            transform.start(langmark_)
+
+    def run(self, element):
+        """
+        Visit element and its descendants in pre-order; the visitors can
+        modify the children of the visited node, which are traversed after
+        it.
+        """
+        for node in element.iterate_preorder():
+            for callback in self._get_callbacks(node.__class__):
+                callback(node)
+
+    def finish(self, langmark_):
+        for transform in self.transforms:
+            transform.finish(langmark_)
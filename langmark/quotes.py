@@ -37,6 +37,7 @@ class BlockQuote(elements._BlockElementContainingBlock):
         > > quoted text
         > quoted text
     """
+    __slots__ = ()
     # TODO: For the moment it's impossible to have two separate quote blocks
     #       without other elements between them
     HTML_TAGS = ('<blockquote>', '</blockquote>')
@@ -55,6 +56,7 @@ class QuoteElements(_ElementFactory):
     Factory for quote block elements.
     """
     TEST_START_LINES = 1
+    REORDERABLE = True
     BLOCK_CHAR = '>'
     BLOCK_MARK = marks.BlockMarkPrefixCompact(BLOCK_CHAR)
 
@@ -0,0 +1,261 @@
+# Langmark - A powerful and extensible lightweight markup language.
+# Copyright (C) 2015 Dario Giovannetti <dev@dariogiovannetti.net>
+#
+# This file is part of Langmark.
+#
+# Langmark is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Langmark is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import array
+import struct
+from .base import _Text, RawText
+from .exceptions import SerializationError
+
+# The format starts with MAGIC and VERSION, followed by the records listed in
+#  TreeWriter.write, each prefixed with its length in bytes
+# Increase VERSION whenever the format changes
+MAGIC = b'LANGMARK'
+VERSION = 1
+HEADER = struct.Struct('<8sH')
+LENGTH = struct.Struct('<Q')
+
+
+def _make_key(Class):
+    return '.'.join((Class.__module__, Class.__name__))
+
+
+class TreeWriter:
+    """
+    Serialize an elements tree and the meta data of its document to a binary
+    stream.
+    """
+    __slots__ = ('element_classes', 'meta_elements', 'class_to_kind',
+                 'keys', 'kinds', 'child_counts', 'text_lengths', 'texts',
+                 'attributes')
+
+    def __init__(self, element_classes, meta_elements):
+        self.element_classes = element_classes
+        self.meta_elements = meta_elements
+        # The kinds written to the stream are indices in self.keys, which only
+        #  lists the classes found in the tree
+        self.class_to_kind = {}
+        self.keys = []
+        # The nodes are stored in pre-order
+        self.kinds = array.array('H')
+        self.child_counts = array.array('I')
+        # -1 for the nodes without text; the texts are concatenated in a
+        #  single string
+        self.text_lengths = array.array('i')
+        self.texts = []
+        self.attributes = {}
+
+    def _get_kind(self, Class):
+        try:
+            return self.class_to_kind[Class]
+        except KeyError:
+            if Class not in self.element_classes:
+                raise SerializationError('{} is not in SERIALIZABLE_ELEMENTS'
+                                         .format(_make_key(Class)))
+            kind = self.class_to_kind[Class] = len(self.keys)
+            self.keys.append(_make_key(Class))
+            return kind
+
+    def _add_text(self, text):
+        if text is None:
+            self.text_lengths.append(-1)
+        else:
+            self.text_lengths.append(len(text))
+            self.texts.append(text)
+
+    def add_tree(self, root):
+        # Use a stack instead of recursing, so that the depth of the tree is
+        #  not limited by the maximum recursion depth
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, _Text):
+                # Source texts are loaded as raw texts
+                self.kinds.append(self._get_kind(RawText))
+                self.child_counts.append(0)
+                self._add_text(node.get_raw_text())
+                continue
+            self.kinds.append(self._get_kind(node.__class__))
+            self.child_counts.append(len(node.children))
+            self._add_text(node.rawtext.get_raw_text() if node.STORE_RAWTEXT
+                           else None)
+            if node.COMPACT_ATTRIBUTES:
+                # The keys of JSON objects can only be strings
+                self.attributes[str(len(self.kinds) - 1)] = [getattr(node,
+                                name) for name in node.COMPACT_ATTRIBUTES]
+            stack.extend(reversed(node.children))
+
+    def _dump_meta_data(self, langmark_):
+        data = {}
+        for Meta in self.meta_elements:
+            try:
+                data[Meta.ATTRIBUTE_NAME] = getattr(langmark_,
+                                            Meta.ATTRIBUTE_NAME).dump_data()
+            except NotImplementedError:
+                pass
+        return data
+
+    @staticmethod
+    def _write_record(stream, data):
+        stream.write(LENGTH.pack(len(data)))
+        stream.write(data)
+
+    @staticmethod
+    def _to_bytes(array_):
+        if sys.byteorder != 'little':
+            array_ = array.array(array_.typecode, array_)
+            array_.byteswap()
+        return array_.tobytes()
+
+    def write(self, langmark_, stream):
+        stream.write(HEADER.pack(MAGIC, VERSION))
+        self._write_record(stream, json.dumps(self.keys).encode())
+        self._write_record(stream, self._to_bytes(self.kinds))
+        self._write_record(stream, self._to_bytes(self.child_counts))
+        self._write_record(stream, self._to_bytes(self.text_lengths))
+        texts = ''.join(self.texts).encode(errors='surrogatepass')
+        self._write_record(stream, texts)
+        self._write_record(stream, json.dumps(self.attributes).encode())
+        self._write_record(stream, json.dumps(self._dump_meta_data(langmark_)
+                                              ).encode())
+
+
+class TreeReader:
+    """
+    Rebuild an elements tree and the meta data of its document from a stream
+    written by TreeWriter.
+    """
+    __slots__ = ('key_to_class', 'meta_elements', 'stream')
+
+    def __init__(self, element_classes, meta_elements, stream):
+        self.key_to_class = {_make_key(Class): Class
+                             for Class in element_classes}
+        self.meta_elements = meta_elements
+        self.stream = stream
+
+    def _read(self, size):
+        try:
+            data = self.stream.read(size)
+        except OverflowError:
+            raise SerializationError('corrupted record length')
+        if len(data) != size:
+            raise SerializationError('unexpected end of stream')
+        return data
+
+    def _read_record(self):
+        return self._read(LENGTH.unpack(self._read(LENGTH.size))[0])
+
+    def _read_array(self, typecode):
+        array_ = array.array(typecode)
+        try:
+            array_.frombytes(self._read_record())
+        except ValueError:
+            raise SerializationError('corrupted {} array'.format(typecode))
+        if sys.byteorder != 'little':
+            array_.byteswap()
+        return array_
+
+    def _read_json(self):
+        try:
+            return json.loads(self._read_record().decode())
+        except ValueError:
+            raise SerializationError('corrupted JSON record')
+
+    def _load_meta_data(self, langmark_, data):
+        for Meta in self.meta_elements:
+            meta = Meta(langmark_)
+            # The meta elements that don't implement dump_data aren't stored
+            if Meta.ATTRIBUTE_NAME in data:
+                meta.load_data(data[Meta.ATTRIBUTE_NAME])
+            setattr(langmark_, Meta.ATTRIBUTE_NAME, meta)
+
+    @staticmethod
+    def _make_element(langmark_, Class, parent, child_count):
+        # Skip __init__, which would start parsing
+        element = Class.__new__(Class)
+        element.langmark = langmark_
+        element.parent = parent
+        element.children = [] if child_count or Class.HAS_CHILDREN else ()
+        return element
+
+    def read(self, langmark_):
+        magic, version = HEADER.unpack(self._read(HEADER.size))
+        if magic != MAGIC:
+            raise SerializationError('not a serialized Langmark tree')
+        if version != VERSION:
+            raise SerializationError('unsupported format version {}'.format(
+                                                                    version))
+        try:
+            classes = [self.key_to_class[key] for key in self._read_json()]
+        except KeyError as exc:
+            raise SerializationError('{} is not in SERIALIZABLE_ELEMENTS'
+                                     .format(exc.args[0]))
+        kinds = self._read_array('H')
+        child_counts = self._read_array('I')
+        text_lengths = self._read_array('i')
+        texts = self._read_record().decode(errors='surrogatepass')
+        attributes = self._read_json()
+        self._load_meta_data(langmark_, self._read_json())
+        if not (len(kinds) == len(child_counts) == len(text_lengths) > 0):
+            raise SerializationError('inconsistent node arrays')
+        # Each item of the stack is an element and the number of children
+        #  that it still has to receive
+        root = None
+        stack = []
+        offset = 0
+        for index, kind in enumerate(kinds):
+            try:
+                Class = classes[kind]
+            except IndexError:
+                raise SerializationError('unknown kind {}'.format(kind))
+            text_length = text_lengths[index]
+            if text_length == -1:
+                text = None
+            else:
+                text = texts[offset:offset + text_length]
+                offset += text_length
+            parent = stack[-1][0] if stack else None
+            if Class is RawText:
+                node = RawText(text)
+            else:
+                node = self._make_element(langmark_, Class, parent,
+                                          child_counts[index])
+                if text is not None:
+                    node.rawtext = RawText(text)
+                try:
+                    values = attributes[str(index)]
+                except KeyError:
+                    pass
+                else:
+                    for name, value in zip(Class.COMPACT_ATTRIBUTES, values):
+                        setattr(node, name, value)
+            if parent is None:
+                if root is not None:
+                    raise SerializationError('more than one root node')
+                root = node
+            else:
+                parent.children.append(node)
+                stack[-1][1] -= 1
+            if not isinstance(node, _Text) and child_counts[index]:
+                stack.append([node, child_counts[index]])
+            while stack and stack[-1][1] == 0:
+                stack.pop()
+        if stack:
+            raise SerializationError('missing nodes')
+        return root
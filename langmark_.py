@@ -18,27 +18,150 @@
 # You should have received a copy of the GNU General Public License
 # along with Langmark.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import sys
+import json
 import argparse
 from langmark import Langmark
+from langmark.base import Limits
+from langmark.factories import FactoryProfile
+from langmark.links import SharedLinks
+from langmark.exceptions import LimitExceeded, SerializationError
+
+LIMITS = ('max_line_length', 'max_depth', 'max_inline_marks', 'max_steps',
+          'max_time')
 
 
 def _parse_cli_args():
     cliparser = argparse.ArgumentParser(description="Parser for the Langmark "
                                         "markup language.", add_help=True)
-    cliparser.add_argument('format', choices=['html'], metavar='FORMAT',
-                        help='the output format, chosen among [%(choices)s]')
-    cliparser.add_argument('source', metavar='SOURCE',
-                        help='the file to be parsed')
-    return cliparser.parse_args()
+    cliparser.add_argument('format',
+                           choices=['html', 'text', 'check', 'header', 'dump'],
+                           metavar='FORMAT',
+                           help='the output format, chosen among '
+                           '[%(choices)s]; text only writes the visible text, '
+                           'check only reports the problems found in the '
+                           'source, header only reads the header keys as '
+                           'JSON, dump writes the parsed document in the '
+                           'binary format read by --load')
+    cliparser.add_argument('sources', nargs='+', metavar='SOURCE',
+                           help='the file to be parsed; the header format '
+                           'accepts several files, which are read in '
+                           'parallel')
+    cliparser.add_argument('--profile', metavar='PROFILE',
+                           help='reorder the block element factories '
+                           'according to the hit counts saved in PROFILE, '
+                           'then save the updated counts to it')
+    cliparser.add_argument('--load', action='store_true',
+                           help='read SOURCE as a document written by the '
+                           'dump format, instead of parsing it')
+    cliparser.add_argument('--compact-tree', action='store_true',
+                           help='store the parsed elements in arrays instead '
+                           'of an object per element, for very large '
+                           'documents')
+    cliparser.add_argument('--text-link-urls', action='store_true',
+                           help='in the text format, also write the URLs of '
+                           'the links after their text')
+    cliparser.add_argument('--heading-ids', action='store_true',
+                           help='in the html format, give the headings an id '
+                           'attribute for linking to them')
+    cliparser.add_argument('--section-divs', action='store_true',
+                           help='in the html format, enclose each heading '
+                           'and the elements that follow it in a div tag')
+    cliparser.add_argument('--shared-links', metavar='FILE',
+                           help='also resolve the link ids defined in FILE, '
+                           'a JSON object mapping the ids to [url, title] '
+                           'arrays')
+    cliparser.add_argument('--extra-escapes', default='', metavar='CHARS',
+                           help='in the html format, also escape the '
+                           'characters in CHARS, among ">", double and '
+                           'single quotes')
+    cliparser.add_argument('--preserve-entities', action='store_true',
+                           help='in the html format, do not escape "&" when '
+                           'it starts a character reference like "&amp;"')
+    cliparser.add_argument('--max-line-length', type=int, metavar='N',
+                           help='fail on source lines longer than N '
+                           'characters')
+    cliparser.add_argument('--max-depth', type=int, metavar='N',
+                           help='fail on block containers nested deeper '
+                           'than N')
+    cliparser.add_argument('--max-inline-marks', type=int, metavar='N',
+                           help='fail on blocks with more than N inline '
+                           'marks')
+    cliparser.add_argument('--max-steps', type=int, metavar='N',
+                           help='fail after N source lines and inline marks')
+    cliparser.add_argument('--max-time', type=float, metavar='SECONDS',
+                           help='fail if parsing takes longer than SECONDS')
+    cliargs = cliparser.parse_args()
+    if cliargs.format != 'header' and len(cliargs.sources) > 1:
+        cliparser.error('only the header format accepts more than one '
+                        'SOURCE')
+    if cliargs.load and cliargs.format in ('check', 'header'):
+        cliparser.error('the {} format cannot be used with --load'
+                        .format(cliargs.format))
+    if cliargs.shared_links:
+        # Replace the path with the loaded table
+        try:
+            with open(cliargs.shared_links, 'r') as stream:
+                cliargs.shared_links = SharedLinks.load(stream)
+        except (OSError, ValueError) as exc:
+            cliparser.error('cannot load the shared links from {}: {}'
+                            .format(cliargs.shared_links, exc))
+    return cliargs
 
 
 def main():
     cliargs = _parse_cli_args()
-    doc = Langmark()
-    with open(cliargs.source, 'r') as stream:
-        doc.parse(stream)
+    if cliargs.format == 'header':
+        print(json.dumps(dict(Langmark.read_file_headers(cliargs.sources)),
+                         indent=4))
+        return
+    source = cliargs.sources[0]
+    factory_profile = None
+    if cliargs.profile:
+        factory_profile = FactoryProfile()
+        if os.path.exists(cliargs.profile):
+            with open(cliargs.profile, 'r') as stream:
+                factory_profile.load(stream)
+    limits = None
+    if any(getattr(cliargs, name) is not None for name in LIMITS):
+        limits = Limits(**{name: getattr(cliargs, name) for name in LIMITS})
+    doc = Langmark(factory_profile=factory_profile,
+                   compact_tree=cliargs.compact_tree,
+                   limits=limits,
+                   text_link_urls=cliargs.text_link_urls,
+                   heading_ids=cliargs.heading_ids,
+                   section_divs=cliargs.section_divs,
+                   shared_links=cliargs.shared_links,
+                   extra_escapes=cliargs.extra_escapes,
+                   preserve_entities=cliargs.preserve_entities)
+    try:
+        if cliargs.format == 'check':
+            with open(source, 'r') as stream:
+                diagnostics = doc.validate(stream)
+        elif cliargs.load:
+            with open(source, 'rb') as stream:
+                doc.load(stream)
+        else:
+            doc.parse_file(source)
+    except (LimitExceeded, SerializationError) as exc:
+        sys.exit('{}: {}'.format(source, exc))
+    if factory_profile:
+        with open(cliargs.profile, 'w') as stream:
+            factory_profile.save(stream)
+    if cliargs.format == 'check':
+        for diagnostic in diagnostics:
+            print('{}: {}'.format(source, diagnostic))
+        sys.exit(1 if diagnostics else 0)
+    if cliargs.format == 'dump':
+        try:
+            doc.dump(sys.stdout.buffer)
+        except SerializationError as exc:
+            sys.exit('{}: {}'.format(source, exc))
+        return
     print({
         'html': doc.etree.convert_to_html,
+        'text': doc.etree.convert_to_text,
     }[cliargs.format]())
 
 if __name__ == '__main__':